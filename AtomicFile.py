@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+def write_atomic(path, data):
+    """
+    Write bytes, text (as UTF-8) or an iterable of byte chunks to path. The data goes to a
+    temporary file in the same folder, which replaces path only once it is complete, so
+    readers never see a partial file; it is removed again if writing fails.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                for chunk in data:
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
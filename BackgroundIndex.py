@@ -0,0 +1,108 @@
+from AtomicFile import write_atomic
+from MediaProbe import probe_video
+import Instrumentation
+from bisect import bisect_right
+from collections import namedtuple
+import json
+import os
+import threading
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.webm', '.avi')
+INDEX_FILENAME = 'index.json'
+
+# Probed properties of one background video; keyframes are sorted timestamps in seconds
+BackgroundClip = namedtuple('BackgroundClip', ['path', 'duration', 'fps', 'width', 'height', 'keyframes'])
+
+def keyframe_start(clip, duration, rng):
+    """Random start offset in clip for a slice of duration seconds, snapped to the keyframe at or before it"""
+    max_start_time = clip.duration - duration
+    position = rng.uniform(0, max(0, max_start_time))
+    keyframe = bisect_right(clip.keyframes, position) - 1
+    start_time = clip.keyframes[keyframe] if keyframe >= 0 else 0.0
+    return min(start_time, max_start_time)
+
+class BackgroundIndex:
+    """
+    Persistent index of background videos: duration, fps, resolution and keyframe timestamps,
+    stored as index.json in the folder holding the videos. Entries are validated against the
+    file's (mtime, size), so each video is probed once and again only after it changes.
+    """
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.folder = os.path.dirname(os.path.abspath(index_path))
+        # file name -> probed properties plus the 'mtime_ns'/'size' signature they were probed at
+        self.entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('clips', {})
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Could not read background index {index_path}, rebuilding it: {e}")
+
+    @classmethod
+    def for_path(cls, input_video_path):
+        """Index of the folder input_video_path names, or of the folder containing that video"""
+        folder = input_video_path if os.path.isdir(input_video_path) else os.path.dirname(os.path.abspath(input_video_path))
+        return cls(os.path.join(folder, INDEX_FILENAME))
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        if os.path.dirname(path) == self.folder:
+            return os.path.basename(path)
+        return path
+
+    def clip(self, path):
+        """Indexed properties of one video, probing it only when it is new or has changed"""
+        stat = os.stat(path)
+        key = self._key(path)
+        entry = self.entries.get(key)
+        hit = entry is not None and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size
+        Instrumentation.cache('background_index', hit)
+        if not hit:
+            print(f"Indexing background video {path}...")
+            entry = dict(probe_video(path), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            with self._lock:
+                self.entries[key] = entry
+                self._dirty = True
+        return BackgroundClip(path, entry['duration'], entry['fps'], entry['width'], entry['height'], entry['keyframes'])
+
+    def clips(self, input_video_path):
+        """Every indexed background under input_video_path: the video itself, or all videos in the folder, sorted by name"""
+        if not os.path.isdir(input_video_path):
+            return [self.clip(input_video_path)]
+        names = sorted(name for name in os.listdir(input_video_path) if name.lower().endswith(VIDEO_EXTENSIONS))
+        clips = []
+        for name in names:
+            try:
+                clips.append(self.clip(os.path.join(input_video_path, name)))
+            except Exception as e:
+                print(f"Skipping background video {name}: {e}")
+        return clips
+
+    def choose_clip(self, input_video_path, duration, rng):
+        """Picks a background at least duration long"""
+        candidates = [clip for clip in self.clips(input_video_path) if clip.duration >= duration]
+        self.save()
+        if not candidates:
+            raise ValueError("Length of video is shorter than total audio duration.")
+        return rng.choice(candidates)
+
+    def choose(self, input_video_path, duration, rng):
+        """
+        Picks a background at least duration long and a start offset snapped to the keyframe at
+        or before a random position, so the decoder starts exactly at the cut instead of decoding
+        up to a whole GOP it then throws away. Returns (clip, start_time).
+        """
+        clip = self.choose_clip(input_video_path, duration, rng)
+        return clip, keyframe_start(clip, duration, rng)
+
+    def save(self):
+        """Write the index if any entry changed; atomic replace, so concurrent jobs never read a partial file"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'clips': self.entries}, indent=2)
+            self._dirty = False
+        write_atomic(self.index_path, data)
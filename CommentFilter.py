@@ -0,0 +1,121 @@
+import heapq
+import re
+
+_LINK_RE = re.compile(r'https?://')
+
+# Average speech pace at speaking rate 1.0, used to turn a target duration into a word count
+WORDS_PER_SECOND = 2.5
+# Below this much remaining budget no comment can fit, so budgeted selection stops scanning
+MIN_COMMENT_SECONDS = 1.0
+
+class CommentFilter:
+    """
+    Declarative filter-and-score pipeline for Reddit comments.
+    Checks are compiled once; filter() and top() make a single pass over the comments.
+
+    score selects the ranking used by top():
+      'order'  - keep the API order (Reddit's default sort), stopping as soon as k comments match
+      'ups'    - most upvoted first
+      'length' - closest to target_seconds of speech at the given speaking_rate
+      callable - score(data, word_count) -> number, higher is better
+    """
+    def __init__(self, max_words=30, blocked_author_substrings=('moderator',), blocklist=None, exclude_links=True,
+                 removed_markers=('[removed]', '[deleted]'), score='order', target_seconds=8.0, speaking_rate=1.0):
+        self.max_words = max_words
+        self.score = score
+        self.target_words = target_seconds * WORDS_PER_SECOND * speaking_rate
+
+        # All body checks are precompiled into a set lookup and one rejection regex
+        self.removed_markers = frozenset(removed_markers)
+        self.blocked_authors = tuple(s.lower() for s in blocked_author_substrings)
+        reject_patterns = [_LINK_RE.pattern] if exclude_links else []
+        reject_patterns += [f"(?:{pattern})" for pattern in blocklist or ()]
+        self.reject_re = re.compile('|'.join(reject_patterns), re.IGNORECASE) if reject_patterns else None
+
+        if callable(score):
+            self.scorer = score
+        elif score == 'ups':
+            self.scorer = lambda data, words: data.get('ups') or 0
+        elif score == 'length':
+            self.scorer = lambda data, words: -abs(words - self.target_words)
+        elif score == 'order':
+            self.scorer = None
+        else:
+            raise ValueError(f"Unknown comment score: {score}")
+
+    def _matches(self, comments):
+        """Yields (position, data, word_count) for every comment passing all checks, cheapest checks first"""
+        max_words = self.max_words
+        removed_markers = self.removed_markers
+        blocked_authors = self.blocked_authors
+        reject_search = self.reject_re.search if self.reject_re is not None else None
+        for position, data in enumerate(comments):
+            body = data.get('body') or ''
+            if body in removed_markers:
+                continue
+            # Splitting at most max_words times bounds the work on very long comments
+            word_count = len(body.split(None, max_words))
+            if word_count > max_words:
+                continue
+            if reject_search is not None and reject_search(body) is not None:
+                continue
+            if blocked_authors:
+                author = (data.get('author') or '').lower()
+                if any(blocked in author for blocked in blocked_authors):
+                    continue
+            yield position, data, word_count
+
+    @staticmethod
+    def to_comment(data):
+        return {
+            'author': data.get('author'),
+            'body': data.get('body'),
+            'upvotes': data.get('ups'),
+            'downvotes': data.get('downs')
+        }
+
+    def filter(self, comments):
+        """All matching comments, in input order"""
+        return [self.to_comment(data) for _, data, _ in self._matches(comments)]
+
+    def top(self, comments, k):
+        """The k best matching comments by the configured score, best first"""
+        if k <= 0:
+            return []
+        matches = self._matches(comments)
+        if self.scorer is None:
+            selected = []
+            for _, data, _ in matches:
+                selected.append(self.to_comment(data))
+                if len(selected) >= k:
+                    break
+            return selected
+
+        scorer = self.scorer
+        # Ties keep the API order; positions are unique, so the data dicts are never compared
+        best = heapq.nlargest(k, ((scorer(data, words), -position, data) for position, data, words in matches))
+        return [self.to_comment(data) for _, _, data in best]
+
+    def top_within_budget(self, comments, budget_seconds, estimate, k=None):
+        """
+        Packs the best matching comments, in ranking order, into budget_seconds of predicted
+        speech. estimate(body) returns predicted seconds. A comment that does not fit is
+        skipped in favour of shorter ones further down. At most k comments are returned.
+        """
+        matches = self._matches(comments)
+        if self.scorer is None:
+            ranked = (data for _, data, _ in matches)
+        else:
+            scorer = self.scorer
+            ranked = (data for _, _, data in sorted(((scorer(data, words), -position, data) for position, data, words in matches), reverse=True))
+
+        selected = []
+        remaining = budget_seconds
+        for data in ranked:
+            if (k is not None and len(selected) >= k) or remaining < MIN_COMMENT_SECONDS:
+                break
+            duration = estimate(data.get('body') or '')
+            if duration <= remaining:
+                selected.append(self.to_comment(data))
+                remaining -= duration
+        return selected
@@ -0,0 +1,208 @@
+from AtomicFile import write_atomic
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import requests
+import Instrumentation
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class HttpError(Exception):
+    """A request that still failed after its retries; status_code is None for connection errors"""
+    def __init__(self, url, status_code=None, retry_after=None, reason=None):
+        self.url = url
+        self.status_code = status_code
+        # Seconds the server asked to wait before the next request, when it said so
+        self.retry_after = retry_after
+        message = f"Failed to fetch {url}: {status_code if reason is None else reason}"
+        if retry_after is not None:
+            message += f" (retry after {retry_after:.0f} seconds)"
+        super().__init__(message)
+
+class RateLimitError(HttpError):
+    """Still rate limited (429) after every retry"""
+
+class HttpService:
+    """
+    Shared HTTP client: one pooled requests.Session, bounded retries with backoff that
+    respects rate-limit headers, and an on-disk response cache with TTL and
+    ETag/If-Modified-Since revalidation.
+    """
+    def __init__(self, cache_dir='./cache/http', ttl=300, max_retries=4, backoff=1.0, max_delay=60,
+                 timeout=(5, 30), pool_size=16, user_agent='RedditThreadFetcherBot/1.0'):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-agent'] = user_agent
+        # Requests wait until this time after the server reported an exhausted rate limit
+        self._rate_limited_until = 0
+        self._lock = threading.Lock()
+
+    def get_json(self, url, params=None, ttl=None):
+        return json.loads(self.get(url, params=params, ttl=ttl))
+
+    def get(self, url, params=None, ttl=None):
+        """Return the response body as bytes, from the cache when it is fresh enough"""
+        with self.open(url, params=params, ttl=ttl) as f:
+            return f.read()
+
+    def open(self, url, params=None, ttl=None):
+        """
+        Return the response body as a binary file object, from the cache when it is fresh enough.
+        Downloads are streamed to disk in chunks, so large payloads are never held in memory.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        body_path, meta_path = self._cache_paths(url, params)
+        meta = self._read_meta(meta_path) if body_path else None
+        if meta is not None and not os.path.exists(body_path):
+            meta = None
+
+        if meta is not None and time.time() - meta['fetched_at'] < ttl:
+            Instrumentation.cache('http', True)
+            return open(body_path, 'rb')
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with Instrumentation.span('http', url=url) as span:
+            return self._fetch(url, params, headers, meta, body_path, meta_path, span)
+
+    def _fetch(self, url, params, headers, meta, body_path, meta_path, span):
+        response = self._request(url, params, headers)
+        span.set(status=response.status_code)
+        with response:
+            if response.status_code == 304 and meta is not None:
+                # Revalidated: the cached body is used without downloading it again
+                Instrumentation.cache('http', True)
+                Instrumentation.count('http.revalidated')
+                meta['fetched_at'] = time.time()
+                write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+                return open(body_path, 'rb')
+            if response.status_code != 200:
+                error = RateLimitError if response.status_code == 429 else HttpError
+                raise error(url, response.status_code, retry_after=self._retry_after(response))
+            Instrumentation.cache('http', False)
+
+            if not body_path:
+                body = tempfile.TemporaryFile()
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    body.write(chunk)
+                body.seek(0)
+                return body
+
+            write_atomic(body_path, response.iter_content(chunk_size=1 << 16))
+            Instrumentation.file_written('http_cache', body_path)
+            write_atomic(meta_path, json.dumps({
+                'url': url,
+                'params': params,
+                'fetched_at': time.time(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }).encode('utf-8'))
+        return open(body_path, 'rb')
+
+    def _request(self, url, params, headers):
+        """Send a GET, retrying connection errors and retryable statuses with backoff"""
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout, stream=True)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise HttpError(url, reason=e) from e
+                delay = self._backoff_delay(attempt)
+            else:
+                self._track_rate_limit(response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response)
+                response.close()
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                print(f"Request to {url} returned {response.status_code}, retrying in {delay:.1f} seconds.")
+            time.sleep(min(delay, self.max_delay))
+            attempt += 1
+
+    def _backoff_delay(self, attempt):
+        # Exponential backoff with jitter, so parallel workers do not retry in lockstep
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _retry_after(self, response):
+        """Delay requested by Retry-After or Reddit's X-Ratelimit-Reset, in seconds"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        reset = response.headers.get('X-Ratelimit-Reset')
+        if reset:
+            try:
+                return max(0.0, float(reset))
+            except ValueError:
+                pass
+        return None
+
+    def _track_rate_limit(self, response):
+        remaining = response.headers.get('X-Ratelimit-Remaining')
+        reset = response.headers.get('X-Ratelimit-Reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            if float(remaining) < 1:
+                with self._lock:
+                    self._rate_limited_until = max(self._rate_limited_until, time.time() + float(reset))
+        except ValueError:
+            pass
+
+    def _wait_for_rate_limit(self):
+        delay = self._rate_limited_until - time.time()
+        if delay > 0:
+            time.sleep(min(delay, self.max_delay))
+
+    def _cache_paths(self, url, params):
+        if not self.cache_dir:
+            return None, None
+        key_source = json.dumps([url, sorted((params or {}).items())])
+        key = hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f"{base}.body", f"{base}.meta.json"
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+_default_service = None
+_default_lock = threading.Lock()
+
+def default_http_service():
+    """Process-wide HttpService used when callers do not pass their own"""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = HttpService()
+        return _default_service
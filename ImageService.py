@@ -1,6 +1,98 @@
 from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from TextLayout import FontMetrics
+import multiprocessing
 import os
+import Instrumentation
+
+# Cards each pool worker needs before the pool beats rendering in-process. A card takes about
+# 16 ms; a forked worker starts in a few ms, a spawned one (macOS, Windows) takes up to seconds
+CARDS_PER_FORK_WORKER = 16
+CARDS_PER_SPAWN_WORKER = 128
+
+def default_render_workers(card_count):
+    """Process count for render_batch() when none is given: 1 (in-process) unless the batch pays for a pool"""
+    per_worker = CARDS_PER_FORK_WORKER if multiprocessing.get_start_method() == 'fork' else CARDS_PER_SPAWN_WORKER
+    return max(1, min(os.cpu_count() or 1, card_count // per_worker))
+
+# Process-wide cache of loaded fonts, pre-resized icons and pre-rendered card chrome
+_asset_cache = {}
+
+def _cached(key, factory):
+    value = _asset_cache.get(key)
+    Instrumentation.cache('asset', value is not None)
+    if value is None:
+        value = _asset_cache[key] = factory()
+    return value
+
+def load_font(path, size):
+    """Return a FreeTypeFont, parsing the font file only once per process"""
+    return _cached(('font', path, size), lambda: ImageFont.truetype(path, size))
+
+def load_metrics(path, size):
+    """Return the FontMetrics of a font, building its glyph advance table only once per process"""
+    return _cached(('metrics', path, size), lambda: FontMetrics(load_font(path, size)))
+
+def load_icon(path, size):
+    """Return an RGBA icon resized to size, decoding the file only once per process"""
+    return _cached(('icon', path, size), lambda: Image.open(path).convert("RGBA").resize(size))
+
+def clear_asset_cache():
+    _asset_cache.clear()
+
+# Per-process state of render_batch() workers
+_worker_config = None
+_worker_services = {}
+
+def _init_render_worker(config, trace=False):
+    global _worker_config
+    _worker_config = config
+    # A forked worker inherits the parent's tracer with everything it recorded so far;
+    # start empty so drain() only ships the cards back and nothing is merged twice
+    Instrumentation.disable()
+    if trace:
+        Instrumentation.enable()
+    _worker_services.clear()
+    # Warm fonts and assets once per worker instead of once per card
+    _worker_service(config['font_path'])
+
+def _worker_service(font_path):
+    service = _worker_services.get(font_path)
+    if service is None:
+        config = dict(_worker_config, font_path=font_path)
+        service = _worker_services[font_path] = ImageService(**config)
+        try:
+            load_font(service.font_path, service.font_size)
+            load_icon('./assets/avatar.png', service.avatar_size)
+            for icon_path in ('./assets/heart.png', './assets/bubble.png', './assets/share.png'):
+                load_icon(icon_path, (20, 20))
+        except IOError:
+            pass  # Reported per card by create_reddit_style_image
+    return service
+
+def _render_card(card):
+    output_path = _draw_card(lambda font_path: _worker_service(font_path or _worker_config['font_path']), card)
+    if Instrumentation.enabled():
+        # Spans recorded in this worker travel back to the parent's trace with the result
+        return output_path, Instrumentation.drain()
+    return output_path
+
+def _draw_card(service_for, card):
+    """Renders one card with service_for(font_path); a card that fails is reported and yields None"""
+    try:
+        with Instrumentation.span('card', chars=len(card['text'])):
+            output_path = service_for(card.get('font_path')).create_reddit_style_image(
+                card['text'],
+                output_path=card['output_path'],
+                subreddit=card['subreddit'],
+                username=card.get('username', '')
+            )
+    except Exception as e:
+        # One bad card (unreadable font, unwritable path) must not abort the rest of the batch
+        print(f"Error rendering card {card.get('output_path')}: {e}")
+        return None
+    Instrumentation.file_written('card', output_path)
+    return output_path
 
 class ImageService:
     def __init__(self, width=820, background_color=(26, 26, 27),
@@ -13,47 +105,90 @@ class ImageService:
         self.font_size = font_size
         # Font for username and upvotes/downvotes
         self.small_font_size = int(font_size * 0.7)
-        self.small_font = ImageFont.truetype(self.normal_font, self.small_font_size)
+        self.small_font = load_font(self.normal_font, self.small_font_size)
         self.avatar_size = (50, 50)  # Size of the avatar
+        self.text_margin = 20  # Left and right padding of the comment text
+
+    def config(self):
+        """Constructor arguments needed to rebuild this service in another process"""
+        return {
+            'width': self.width,
+            'background_color': self.background_color,
+            'text_color': self.text_color,
+            'font_path': self.font_path,
+            'font_size': self.font_size
+        }
+
+    def header_height(self):
+        # Header height (avatar, username, subreddit)
+        return max(self.avatar_size[1], self.small_font_size * 2 + 10) + 40  # 20 pixels padding
+
+    def layout_text(self, text):
+        """Wrap text to the card's inner width in pixels; the returned TextBlock also gives its exact height"""
+        return load_metrics(self.font_path, self.font_size).wrap(text, self.width - 2 * self.text_margin)
+
+    def _render_chrome(self, total_height, upvote_arrow_path, bubble_path):
+        """Render everything on a card that does not depend on its text or author"""
+        img = Image.new('RGB', (self.width, total_height), color=self.background_color)
+        draw = ImageDraw.Draw(img)
+
+        # Adding user avatar from image in the top left corner
+        avatar_image = load_icon('./assets/avatar.png', self.avatar_size)
+        avatar_position = (10, 10)
+        img.paste(avatar_image, avatar_position, avatar_image)
+
+        # Drawing heart icon with upvotes count and bubble icon with comments count in the bottom left corner
+        upvotes_and_comments_text = "99+"
+        upvote_arrow = load_icon(upvote_arrow_path, (20, 20))
+        bubble = load_icon(bubble_path, (20, 20))
+        upvote_arrow_position = (20, total_height - 30)
+        bubble_position = (upvote_arrow_position[0] + 65, upvote_arrow_position[1])
+        img.paste(upvote_arrow, upvote_arrow_position, upvote_arrow)
+        img.paste(bubble, bubble_position, bubble)
+        draw.text((upvote_arrow_position[0] + 25, upvote_arrow_position[1] - 5), upvotes_and_comments_text, fill='lightgray', font=self.small_font)
+        draw.text((bubble_position[0] + 25, bubble_position[1] - 5), upvotes_and_comments_text, fill='lightgray', font=self.small_font)
+
+        # Drawing share icon and share text next to it in the bottom right corner
+        share_text = "Share"
+        share_icon = load_icon('./assets/share.png', (20, 20))
+        share_icon_position = (self.width - 90, total_height - 30)
+        img.paste(share_icon, share_icon_position, share_icon)
+        draw.text((share_icon_position[0] + 25, share_icon_position[1] - 5), share_text, fill='lightgray', font=self.small_font)
+        return img
+
+    def card_chrome(self, total_height, upvote_arrow_path='./assets/heart.png', bubble_path='./assets/bubble.png'):
+        """Cached card chrome for this width and height; callers must copy() before drawing on it"""
+        key = ('chrome', self.width, total_height, self.background_color, self.normal_font,
+               self.small_font_size, self.avatar_size, upvote_arrow_path, bubble_path)
+        return _cached(key, lambda: self._render_chrome(total_height, upvote_arrow_path, bubble_path))
 
     def create_reddit_style_image(self, text, output_path, subreddit, username="", upvote_arrow_path='./assets/heart.png', bubble_path='./assets/bubble.png'):
         try:
-            font = ImageFont.truetype(self.font_path, self.font_size)
+            font = load_font(self.font_path, self.font_size)
         except IOError:
             print("Error: Cannot open font file. Please ensure the font path is correct.")
             return
 
-        # Wrapping text
-        wrap_width = 45  # Adjust as needed
-        wrapped_text = textwrap.fill(text, width=wrap_width)
-        lines = wrapped_text.split('\n')
-
-        # Setting line height
-        ascent, descent = font.getmetrics()
-        line_height = ascent + descent  # Adding 10 pixels for spacing between lines
+        # Wrapping text by pixel width, measured with the font's cached glyph advances
+        block = self.layout_text(text)
+        lines = block.lines
+        line_height = block.line_height
 
         # Calculating total text height
-        total_text_height = line_height * len(lines)
+        total_text_height = block.height
 
-        # Header height (avatar, username, subreddit)
-        header_height = max(self.avatar_size[1], self.small_font_size * 2 + 10) + 40  # 20 pixels padding
+        header_height = self.header_height()
 
         # Calculating total image height
         total_height = header_height + total_text_height + 25  # 20 pixels padding at the bottom
 
-        # Creating a new image with the calculated height
-        img = Image.new('RGB', (self.width, total_height), color=self.background_color)
-        draw = ImageDraw.Draw(img)
-
-        # Adding user avatar from image in the top left corner
+        # Starting from the pre-rendered background, avatar and footer for this height
         try:
-            avatar_image = Image.open('./assets/avatar.png').convert("RGBA")
-            avatar_image = avatar_image.resize(self.avatar_size)
-            avatar_position = (10, 10)
-            img.paste(avatar_image, avatar_position, avatar_image)
+            img = self.card_chrome(total_height, upvote_arrow_path, bubble_path).copy()
         except IOError:
             print("Error: Cannot open avatar image. Ensure the path is correct.")
             return
+        draw = ImageDraw.Draw(img)
 
         # Drawing username in the top left corner
         username_text = f"u/{username}"
@@ -73,36 +208,48 @@ class ImageService:
         time_ago_position = (subreddit_position[0] + subreddit_text_width + 5, subreddit_position[1])
         draw.text(time_ago_position, time_ago_text, fill=self.text_color, font=self.small_font)
 
-        # Drawing heart icon with upvotes count and bubble icon with comments count in the bottom left corner
-        upvotes_and_comments_text = "99+"
-        upvote_arrow = Image.open(upvote_arrow_path).convert("RGBA")
-        bubble = Image.open(bubble_path).convert("RGBA")
-        upvote_arrow = upvote_arrow.resize((20, 20))
-        bubble = bubble.resize((20, 20))
-        upvote_arrow_position = (20, total_height - 30)
-        bubble_position = (upvote_arrow_position[0] + 65, upvote_arrow_position[1])
-        img.paste(upvote_arrow, upvote_arrow_position, upvote_arrow)
-        img.paste(bubble, bubble_position, bubble)
-        draw.text((upvote_arrow_position[0] + 25, upvote_arrow_position[1] - 5), upvotes_and_comments_text, fill='lightgray', font=self.small_font)
-        draw.text((bubble_position[0] + 25, bubble_position[1] - 5), upvotes_and_comments_text, fill='lightgray', font=self.small_font)
-        
-        # Drawing share icon and share text next to it in the bottom right corner
-        share_text = "Share"
-        share_icon = Image.open('./assets/share.png').convert("RGBA")
-        share_icon = share_icon.resize((20, 20))
-        share_icon_position = (self.width - 90, total_height - 30)
-        img.paste(share_icon, share_icon_position, share_icon)
-        draw.text((share_icon_position[0] + 25, share_icon_position[1] - 5), share_text, fill='lightgray', font=self.small_font)
-
         # Starting y position for text (below the header)
         y = header_height
 
         # Drawing each line of text
         for line in lines:
-            draw.text((20, y), line, fill=self.text_color, font=font, anchor="lm", align="left")
+            draw.text((self.text_margin, y), line, fill=self.text_color, font=font, anchor="lm", align="left")
             y += line_height
 
         # Saving the image
-        os.makedirs('./output_images', exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
         img.save(output_path)
         print(f"Image saved as {output_path}.")
+        return output_path
+
+    def render_batch(self, cards, workers=None):
+        """
+        Renders many cards, across a process pool when workers > 1, and returns their output paths
+        in input order. Each card is a dict with 'text', 'output_path', 'subreddit' and optional
+        'username' and 'font_path' (defaults to this service's font). Cards that fail to render
+        yield None. Without workers, small batches such as one video's cards render in-process.
+        """
+        cards = list(cards)
+        workers = min(workers or default_render_workers(len(cards)), len(cards))
+        with Instrumentation.span('cards', cards=len(cards), workers=workers):
+            return self._render_batch(cards, workers)
+
+    def _render_batch(self, cards, workers):
+        if workers <= 1:
+            services = {self.font_path: self}
+
+            def service_for(font_path):
+                font_path = font_path or self.font_path
+                if font_path not in services:
+                    services[font_path] = ImageService(**dict(self.config(), font_path=font_path))
+                return services[font_path]
+            return [_draw_card(service_for, card) for card in cards]
+
+        trace = Instrumentation.enabled()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker, initargs=(self.config(), trace)) as pool:
+            results = list(pool.map(_render_card, cards, chunksize=max(1, len(cards) // (workers * 4))))
+        if not trace:
+            return results
+        for _, events in results:
+            Instrumentation.merge(events)
+        return [output_path for output_path, _ in results]
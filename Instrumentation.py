@@ -0,0 +1,215 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then left out of the trace
+    resource = None
+
+# The active tracer, or None while instrumentation is disabled (the default)
+_tracer = None
+
+class _NullSpan:
+    """Returned by span() while disabled, so instrumented code costs one global lookup"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'start_wall', 'start')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        rss = peak_rss_mb()
+        if rss is not None:
+            self.attrs['peak_rss_mb'] = rss
+        self.tracer.add_span(self.name, self.start_wall, duration, self.attrs)
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes known only once the span is running, e.g. whether a cache hit"""
+        self.attrs.update(attrs)
+
+class Tracer:
+    """Collects spans and counters from every thread of one process"""
+    def __init__(self):
+        self.started = time.time()
+        # {'name', 'start' (epoch seconds), 'duration' (seconds), 'pid', 'tid', 'attrs'}
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, duration, attrs):
+        record = {'name': name, 'start': start, 'duration': duration, 'pid': os.getpid(),
+                  'tid': threading.get_ident(), 'attrs': attrs}
+        with self._lock:
+            self.spans.append(record)
+
+    def count(self, name, amount):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def drain(self):
+        """Take everything recorded so far, e.g. to ship it from a worker process to the parent"""
+        with self._lock:
+            events = {'spans': self.spans, 'counters': self.counters}
+            self.spans, self.counters = [], {}
+        return events
+
+    def merge(self, events):
+        with self._lock:
+            self.spans.extend(events['spans'])
+            for name, amount in events['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+def enable():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+def disable():
+    global _tracer
+    _tracer = None
+
+def enabled():
+    return _tracer is not None
+
+def span(name, **attrs):
+    """Context manager timing one pipeline step; a no-op while disabled"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, attrs)
+
+def count(name, amount=1):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(name, amount)
+
+def cache(name, hit):
+    """Count a hit or miss of the named cache"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(f"cache.{name}.{'hit' if hit else 'miss'}", 1)
+
+def bytes_written(kind, amount):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(f"bytes_written.{kind}", amount)
+
+def file_written(kind, path):
+    """Count the size of a file just written; the file is only stat'ed while enabled"""
+    tracer = _tracer
+    if tracer is not None and path and os.path.exists(path):
+        tracer.count(f"bytes_written.{kind}", os.path.getsize(path))
+
+def drain():
+    return _tracer.drain() if _tracer is not None else None
+
+def merge(events):
+    if _tracer is not None and events:
+        _tracer.merge(events)
+
+def _max_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB, or None when unknown"""
+    return _max_rss_mb(resource.RUSAGE_SELF if resource else None)
+
+def peak_children_rss_mb():
+    """Largest peak RSS of any finished child process, e.g. ffmpeg, in MB"""
+    return _max_rss_mb(resource.RUSAGE_CHILDREN if resource else None)
+
+def summary_rows():
+    """Per span name: (name, count, total seconds, mean seconds, max seconds), slowest total first"""
+    if _tracer is None:
+        return []
+    totals = {}
+    for record in _tracer.spans:
+        entry = totals.setdefault(record['name'], [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += record['duration']
+        entry[2] = max(entry[2], record['duration'])
+    rows = [(name, n, total, total / n, longest) for name, (n, total, longest) in totals.items()]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows
+
+def format_summary():
+    lines = [f"{'span':<20} {'count':>7} {'total s':>10} {'mean s':>10} {'max s':>10}"]
+    for name, n, total, mean, longest in summary_rows():
+        lines.append(f"{name:<20} {n:>7} {total:>10.3f} {mean:>10.4f} {longest:>10.3f}")
+    if _tracer is not None:
+        for name in sorted(_tracer.counters):
+            lines.append(f"{name:<40} {_tracer.counters[name]:>12}")
+    lines.append(f"{'peak RSS MB':<40} {peak_rss_mb()}")
+    lines.append(f"{'peak child RSS MB':<40} {peak_children_rss_mb()}")
+    return '\n'.join(lines)
+
+def write_trace(path):
+    """
+    Writes the trace in Chrome trace event format, loadable in chrome://tracing or Perfetto,
+    with the counters, peak RSS and per-span summary as extra top-level keys.
+    """
+    if _tracer is None:
+        return
+    events = [{
+        'name': record['name'],
+        'cat': 'pipeline',
+        'ph': 'X',
+        'ts': round((record['start'] - _tracer.started) * 1e6),
+        'dur': round(record['duration'] * 1e6),
+        'pid': record['pid'],
+        'tid': record['tid'],
+        'args': record['attrs']
+    } for record in _tracer.spans]
+    trace = {
+        'traceEvents': events,
+        'counters': _tracer.counters,
+        'peakRssMb': peak_rss_mb(),
+        'peakChildRssMb': peak_children_rss_mb(),
+        'summary': [dict(zip(('name', 'count', 'total', 'mean', 'max'), row)) for row in summary_rows()]
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f, indent=1)
+
+def report(trace_path=None, summary=False):
+    """Write the trace file and/or print the summary table, as requested on the command line"""
+    if _tracer is None:
+        return
+    if trace_path:
+        write_trace(trace_path)
+        print(f"Trace saved as {trace_path}.")
+    if summary:
+        print(format_summary())
@@ -0,0 +1,206 @@
+import json
+import os
+import struct
+import subprocess
+import Instrumentation
+
+# MPEG audio header tables, indexed by the version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000)
+}
+_BITRATES_MPEG1 = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),   # Layer III
+    2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),  # Layer II
+    3: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448)  # Layer I
+}
+_BITRATES_MPEG2 = {
+    1: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    3: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256)
+}
+
+# Enough of the file for the first frame and its Xing/Info/VBRI header after any junk
+_HEADER_BYTES = 64 * 1024
+
+# Durations keyed by path, validated against (mtime, size) so edited files are re-probed
+_duration_cache = {}
+
+def _parse_frame_header(data, offset):
+    """Return (frame_length, samples_per_frame, sample_rate, version, channel_mode) or None"""
+    if offset + 4 > len(data):
+        return None
+    header = struct.unpack('>I', data[offset:offset + 4])[0]
+    if header & 0xFFE00000 != 0xFFE00000:
+        return None
+    version = (header >> 19) & 0x3
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+    padding = (header >> 9) & 0x1
+    channel_mode = (header >> 6) & 0x3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrates = _BITRATES_MPEG1 if version == 3 else _BITRATES_MPEG2
+    bitrate = bitrates[layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 3:  # Layer I
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or version == 3:  # Layer II, or Layer III in MPEG-1
+        samples = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:  # Layer III in MPEG-2/2.5
+        samples = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+    return frame_length, samples, sample_rate, version, channel_mode
+
+def _skip_id3v2(data):
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+def _vbr_frame_count(data, offset, version, channel_mode):
+    """Frame count from a Xing/Info or VBRI header in the first frame, if present"""
+    mono = channel_mode == 3
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 0x1:
+            return struct.unpack('>I', data[xing + 8:xing + 12])[0]
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI':
+        return struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+    return None
+
+def _find_first_frame(data, offset):
+    """Resynchronise on the first valid frame header at or after offset; returns (offset, header) or (None, None)"""
+    while True:
+        offset = data.find(b'\xff', offset)
+        if offset < 0:
+            return None, None
+        frame = _parse_frame_header(data, offset)
+        if frame is not None:
+            return offset, frame
+        offset += 1
+
+def mp3_duration(path):
+    """
+    Duration of an MP3 file read from its frame headers, without decoding any audio.
+    Uses the Xing/Info/VBRI frame count when available, which needs only the start of the
+    file, and otherwise reads the rest and walks the frame headers.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(_HEADER_BYTES)
+        tag_length = _skip_id3v2(data)
+        if tag_length:
+            # Cover art can make the tag longer than the prefix, so read the prefix after it
+            f.seek(tag_length)
+            data = f.read(_HEADER_BYTES)
+        complete = len(data) < _HEADER_BYTES
+
+        offset, first = _find_first_frame(data, 0)
+        if first is None and not complete:
+            data += f.read()
+            complete = True
+            offset, first = _find_first_frame(data, 0)
+        if first is None:
+            raise ValueError(f"No MPEG audio frames found in {path}")
+
+        frame_length, samples, sample_rate, version, channel_mode = first
+        frame_count = _vbr_frame_count(data, offset, version, channel_mode)
+        if frame_count is not None:
+            return frame_count * samples / sample_rate
+        if not complete:
+            data += f.read()
+
+    total_samples = 0
+    while True:
+        frame = _parse_frame_header(data, offset)
+        # A frame cut off by the end of the file holds no complete audio
+        if frame is None or frame[0] <= 0 or offset + frame[0] > len(data):
+            break
+        total_samples += frame[1]
+        offset += frame[0]
+    return total_samples / sample_rate
+
+def ffprobe_duration(path):
+    """Read the container duration of a media file with ffprobe"""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip())
+
+def audio_duration(path):
+    """Cached duration of an audio file, from MP3 headers when possible and ffprobe otherwise"""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _duration_cache.get(path)
+    hit = cached is not None and cached[0] == signature
+    Instrumentation.cache('probe', hit)
+    if hit:
+        return cached[1]
+
+    duration = None
+    with Instrumentation.span('probe', path=path) as span:
+        if path.lower().endswith('.mp3'):
+            try:
+                duration = mp3_duration(path)
+            except (ValueError, struct.error):
+                # Not a parsable MP3, or truncated inside a header: ffprobe decides
+                pass
+        if duration is None:
+            span.set(ffprobe=True)
+            duration = ffprobe_duration(path)
+    _duration_cache[path] = (signature, duration)
+    return duration
+
+def clear_duration_cache():
+    _duration_cache.clear()
+
+def _frame_rate(rate):
+    """ffprobe rational such as '30000/1001' as a float, 0 when unknown"""
+    numerator, _, denominator = (rate or '0').partition('/')
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def probe_video(path):
+    """
+    Duration, fps, resolution and keyframe timestamps of a video's first video stream.
+    Keyframes come from packet flags, so nothing is decoded.
+    """
+    with Instrumentation.span('probe_video', path=path):
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+             '-show_entries', 'format=duration:stream=width,height,avg_frame_rate,r_frame_rate:packet=pts_time,flags',
+             '-of', 'json', path],
+            capture_output=True, text=True, check=True
+        )
+    info = json.loads(result.stdout)
+    streams = info.get('streams') or []
+    if not streams:
+        raise ValueError(f"No video stream found in {path}")
+    stream = streams[0]
+
+    fps = _frame_rate(stream.get('avg_frame_rate')) or _frame_rate(stream.get('r_frame_rate'))
+    keyframes = sorted(float(packet['pts_time']) for packet in info.get('packets') or []
+                       if 'K' in packet.get('flags', '') and packet.get('pts_time') not in (None, 'N/A'))
+    return {
+        'duration': float(info['format']['duration']),
+        'fps': fps,
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'keyframes': keyframes or [0.0]
+    }
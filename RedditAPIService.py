@@ -1,26 +1,57 @@
-import requests
+from HttpService import default_http_service
+from CommentFilter import CommentFilter
+from ThreadParser import parse_thread
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+
+MORECHILDREN_URL = 'https://www.reddit.com/api/morechildren.json'
+MORECHILDREN_BATCH = 100  # Maximum number of ids the endpoint accepts per request
 
 class RedditAPIService:
-    def __init__(self, thread_url):
+    def __init__(self, thread_url, http=None):
         if not thread_url.endswith('.json'):
             self.thread_url = thread_url + '.json'
         else:
             self.thread_url = thread_url
         self.thread_data = None
+        # Compact records from a streaming parse, used instead of thread_data when set
+        self.parsed = None
+        # Pooled, retrying and caching HTTP client, shared process-wide unless one is passed in
+        self.http = http or default_http_service()
 
-    def fetch_thread(self):
-        headers = {'User-agent': 'RedditThreadFetcherBot/1.0'}
-        response = requests.get(self.thread_url, headers=headers)
-        if response.status_code == 200:
-            self.thread_data = response.json()
+    def fetch_thread(self, stream=False):
+        """
+        Fetches the thread JSON. With stream=True the response is streamed to disk and parsed
+        incrementally into compact records, instead of keeping the full JSON in memory.
+        """
+        if stream:
+            with self.http.open(self.thread_url) as f:
+                self.load_thread_stream(f)
         else:
-            raise Exception(f"Failed to fetch thread: {response.status_code}")
+            self.thread_data = self.http.get_json(self.thread_url)
+            self.parsed = None
 
-    def get_thread_info(self):
-        if self.thread_data is None:
+    def load_thread_stream(self, fp):
+        """Parses a thread JSON document from a binary file object into compact records"""
+        self.parsed = parse_thread(fp)
+        self.thread_data = None
+
+    def load_thread_file(self, path):
+        """Uses a thread JSON saved on disk instead of fetching it"""
+        with open(path, 'rb') as f:
+            self.load_thread_stream(f)
+
+    def _require_thread(self):
+        if self.thread_data is None and self.parsed is None:
             raise Exception("Thread data has not been fetched. Call fetch_thread() first.")
-        # Thread data is in the first element of the list
-        thread = self.thread_data[0]['data']['children'][0]['data']
+
+    def get_thread_info(self):
+        self._require_thread()
+        if self.parsed is not None:
+            thread = self.parsed.thread
+        else:
+            # Thread data is in the first element of the list
+            thread = self.thread_data[0]['data']['children'][0]['data']
         threadText = thread.get('selftext')
         title = thread.get('title')
         author = thread.get('author')
@@ -38,71 +69,101 @@ class RedditAPIService:
             'num_comments': num_comments
         }
 
-    def get_top_comments(self, n, max_words_per_comment=30):
-        if self.thread_data is None:
-            raise Exception("Thread data has not been fetched. Call fetch_thread() first.")
-        # Comments are in the second element of the list
-        comments = self.thread_data[1]['data']['children']
-        top_comments = []
-        count = 0
-        for comment in comments:
-            if comment['kind'] != 'more' and count < n:
-                data = comment['data']
-                authorLowerCase = data.get('author').lower()
-                body = data.get('body')
+    def iter_comments(self, max_depth=0, expand_more=False, max_in_flight=4):
+        """
+        Yields the data of every comment down to max_depth (0 = top-level comments only).
+        Comments from the fetched listing come first, in tree order. With expand_more, "more"
+        stubs are then expanded through the morechildren endpoint with at most max_in_flight
+        concurrent requests, and their comments are yielded as each response arrives.
+        """
+        self._require_thread()
+        pending_more = deque()
+        if self.parsed is not None:
+            for record in self.parsed.comments:
+                if record.depth <= max_depth:
+                    yield record
+            for ids, depth in self.parsed.more_stubs:
+                if depth <= max_depth:
+                    self._queue_more({'children': ids}, pending_more)
+            link_id = self.parsed.thread.name
+        else:
+            # Comments are in the second element of the list
+            yield from self._walk_listing(self.thread_data[1]['data']['children'], 0, max_depth, pending_more)
+            link_id = self.thread_data[0]['data']['children'][0]['data']['name']
+        if not expand_more or not pending_more:
+            return
 
-                # Filter out comments that are too long
-                word_count = len(body.split())
-                if word_count > max_words_per_comment:
-                    continue  # Skip this comment
+        pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        in_flight = set()
+        try:
+            while pending_more or in_flight:
+                while pending_more and len(in_flight) < max_in_flight:
+                    in_flight.add(pool.submit(self._fetch_more_children, link_id, pending_more.popleft()))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        things = future.result()
+                    except Exception as e:
+                        print(f"Could not expand more comments: {e}")
+                        continue
+                    for thing in things:
+                        data = thing['data']
+                        depth = data.get('depth', 0)
+                        if depth > max_depth:
+                            continue
+                        if thing['kind'] == 'more':
+                            self._queue_more(data, pending_more)
+                        elif thing['kind'] == 't1':
+                            yield data
+        finally:
+            # Stop scheduling work if the consumer stops early
+            pool.shutdown(wait=False, cancel_futures=True)
 
-                # Skip comments from users containing "moderator"
-                if "moderator" in authorLowerCase:
-                    continue
+    def _walk_listing(self, children, depth, max_depth, pending_more):
+        for child in children:
+            data = child['data']
+            if child['kind'] == 'more':
+                self._queue_more(data, pending_more)
+                continue
+            if child['kind'] != 't1':
+                continue
+            yield data
+            replies = data.get('replies')
+            if depth < max_depth and isinstance(replies, dict):
+                yield from self._walk_listing(replies['data']['children'], depth + 1, max_depth, pending_more)
 
-                if "https://" in body or "http://" in body or body == "[removed]" or body == "[deleted]":
-                    continue
+    def _queue_more(self, data, pending_more):
+        # "Continue this thread" stubs have no children ids and cannot be expanded here
+        ids = data.get('children') or []
+        for i in range(0, len(ids), MORECHILDREN_BATCH):
+            pending_more.append(ids[i:i + MORECHILDREN_BATCH])
 
-                author = data.get('author')
-                upvotes = data.get('ups')
-                downvotes = data.get('downs')
-                top_comments.append({
-                    'author': author,
-                    'body': body,
-                    'upvotes': upvotes,
-                    'downvotes': downvotes
-                })
-                count += 1
-            if count >= n:
-                break
-        return top_comments
+    def _fetch_more_children(self, link_id, ids):
+        response = self.http.get_json(MORECHILDREN_URL, params={
+            'api_type': 'json',
+            'link_id': link_id,
+            'children': ','.join(ids),
+            'limit_children': 'false',
+            'raw_json': '1'
+        })
+        return response['json']['data']['things']
 
-    def get_all_comments(self, max_words_per_comment=30):
+    def get_top_comments(self, n, max_words_per_comment=30, max_depth=0, expand_more=False, max_in_flight=4,
+                         budget_seconds=None, estimate=None, **filter_options):
         """
-        Returns all available comments, filtered by length and other criteria.
+        Returns the n best comments passing the filter. filter_options are passed to CommentFilter,
+        e.g. score='ups' or blocklist=[r'\bspoiler\b']. With budget_seconds and estimate(body),
+        comments are packed into that much predicted speech before any synthesis runs.
         """
-        if self.thread_data is None:
-            raise Exception("Thread data has not been fetched. Call fetch_thread() first.")
-        comments = self.thread_data[1]['data']['children']
-        all_comments = []
-        for comment in comments:
-            if comment['kind'] != 'more':
-                data = comment['data']
-                authorLowerCase = data.get('author', '').lower()
-                body = data.get('body', '')
-
-                # Filter out comments based on conditions
-                if len(body.split()) > max_words_per_comment:
-                    continue
-                if "moderator" in authorLowerCase or body in ["[removed]", "[deleted]"]:
-                    continue
-                if "https://" in body or "http://" in body:
-                    continue
+        comment_filter = CommentFilter(max_words=max_words_per_comment, **filter_options)
+        comments = self.iter_comments(max_depth, expand_more, max_in_flight)
+        if budget_seconds is not None:
+            return comment_filter.top_within_budget(comments, budget_seconds, estimate, k=n)
+        return comment_filter.top(comments, n)
 
-                all_comments.append({
-                    'author': data.get('author'),
-                    'body': body,
-                    'upvotes': data.get('ups'),
-                    'downvotes': data.get('downs')
-                })
-        return all_comments
+    def get_all_comments(self, max_words_per_comment=30, max_depth=0, expand_more=False, max_in_flight=4, **filter_options):
+        """
+        Returns all available comments, filtered by length and other criteria.
+        """
+        comment_filter = CommentFilter(max_words=max_words_per_comment, **filter_options)
+        return comment_filter.filter(self.iter_comments(max_depth, expand_more, max_in_flight))
@@ -0,0 +1,58 @@
+from AtomicFile import write_atomic
+import json
+import os
+import threading
+
+# Typical pace of Google TTS voices at speaking rate 1.0, used until a voice has been calibrated
+DEFAULT_CHARS_PER_SECOND = 14.0
+# Silence and breathing the synthesizer adds around every utterance
+UTTERANCE_OVERHEAD = 0.3
+
+class SpeechDurationEstimator:
+    """
+    Predicts how long synthesized speech will be before any synthesis runs.
+    Estimate: UTTERANCE_OVERHEAD + characters / (chars_per_second * speaking_rate), where
+    chars_per_second is calibrated per voice from the real durations of synthesized audio.
+    """
+    def __init__(self, calibration_path='./cache/tts/calibration.json'):
+        self.calibration_path = calibration_path
+        # voice key -> {'chars': total characters, 'seconds': total rate-normalized speech seconds}
+        self.calibration = {}
+        self._lock = threading.Lock()
+        if calibration_path and os.path.exists(calibration_path):
+            try:
+                with open(calibration_path, 'r', encoding='utf-8') as f:
+                    self.calibration = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not read TTS calibration {calibration_path}: {e}")
+
+    @staticmethod
+    def voice_key(language_code, voice_name, ssml_gender):
+        return f"{language_code}|{voice_name or ''}|{ssml_gender}"
+
+    def chars_per_second(self, voice_key):
+        entry = self.calibration.get(voice_key)
+        if entry and entry['seconds'] > 0 and entry['chars'] > 0:
+            return entry['chars'] / entry['seconds']
+        return DEFAULT_CHARS_PER_SECOND
+
+    def estimate(self, text, voice_key, speaking_rate=1.0):
+        """Predicted duration of text in seconds"""
+        return UTTERANCE_OVERHEAD + len(text) / (self.chars_per_second(voice_key) * speaking_rate)
+
+    def record(self, text, seconds, voice_key, speaking_rate=1.0):
+        """Adds one real (text, duration) observation to the voice's calibration"""
+        speech_seconds = (seconds - UTTERANCE_OVERHEAD) * speaking_rate
+        if not text or speech_seconds <= 0:
+            return
+        with self._lock:
+            entry = self.calibration.setdefault(voice_key, {'chars': 0, 'seconds': 0.0})
+            entry['chars'] += len(text)
+            entry['seconds'] += speech_seconds
+
+    def save(self):
+        if not self.calibration_path:
+            return
+        with self._lock:
+            data = json.dumps(self.calibration, indent=2)
+        write_atomic(self.calibration_path, data)
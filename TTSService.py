@@ -1,42 +1,164 @@
-from google.cloud import texttospeech
-from dotenv import load_dotenv
+from AtomicFile import write_atomic
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from MediaProbe import audio_duration
+from SpeechEstimator import SpeechDurationEstimator
+import Instrumentation
+import hashlib
+import json
 import os
+import shutil
+import threading
+
+# google.cloud.texttospeech pulls in gRPC and protobuf; it is imported on the first synthesis,
+# so runs served entirely from the TTS cache never pay for it
+texttospeech = None
+
+def _load_texttospeech():
+    global texttospeech
+    if texttospeech is None:
+        from google.cloud import texttospeech as module
+        texttospeech = module
+    return texttospeech
+
+# Everything about the voice that changes the audio; ssml_gender is 'MALE', 'FEMALE' or 'NEUTRAL'
+VoiceParams = namedtuple('VoiceParams', ['language_code', 'name', 'ssml_gender', 'speaking_rate', 'pitch'])
+
+class GoogleTTSBackend:
+    """
+    Google Cloud Text-to-Speech behind the synthesize(text, voice) interface TTSGenerator
+    uses. The SDK, the .env file and the credentials are loaded on the first synthesis.
+    Any object with the same method can replace it, e.g. a local fake in tests.
+    """
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from dotenv import load_dotenv
+                load_dotenv()
+                credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+                self._client = _load_texttospeech().TextToSpeechClient.from_service_account_file(credentials_path)
+            return self._client
+
+    def synthesize(self, text, voice):
+        """Return the MP3 bytes of text spoken with voice (a VoiceParams)"""
+        client = self.client
+        tts = _load_texttospeech()
+        voice_params = {
+            'language_code': voice.language_code,
+            'ssml_gender': getattr(tts.SsmlVoiceGender, voice.ssml_gender)
+        }
+        if voice.name:
+            voice_params['name'] = voice.name
+        audio_config = tts.AudioConfig(
+            audio_encoding=tts.AudioEncoding.MP3,
+            speaking_rate=voice.speaking_rate,
+            pitch=voice.pitch
+        )
+        response = client.synthesize_speech(
+            input=tts.SynthesisInput(text=text),
+            voice=tts.VoiceSelectionParams(**voice_params),
+            audio_config=audio_config
+        )
+        return response.audio_content
 
 class TTSGenerator:
-    def __init__(self, language_code='pl-PL', voice_name=None, ssml_gender='NEUTRAL', speaking_rate=1.2, pitch=0.2):
-        load_dotenv()
-        credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        self.client = texttospeech.TextToSpeechClient.from_service_account_file(credentials_path)
+    def __init__(self, language_code='pl-PL', voice_name=None, ssml_gender='NEUTRAL', speaking_rate=1.2, pitch=0.2,
+                 backend=None, cache_dir='./cache/tts', max_workers=4, estimator=None):
+        # Google TTS unless another backend is given; it may be shared by generators of different voices
+        self.backend = backend or GoogleTTSBackend()
         self.language_code = language_code
         self.voice_name = voice_name
-        self.ssml_gender = getattr(texttospeech.SsmlVoiceGender, ssml_gender)
-        self.audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=speaking_rate,
-            pitch=pitch
-        )
+        self.ssml_gender_name = ssml_gender
+        self.speaking_rate = speaking_rate
+        self.pitch = pitch
+        self.voice = VoiceParams(language_code, voice_name, ssml_gender, speaking_rate, pitch)
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        # Learns this voice's pace from every synthesized file, so durations can be predicted up front
+        self.voice_key = SpeechDurationEstimator.voice_key(language_code, voice_name, ssml_gender)
+        if estimator is None:
+            estimator = SpeechDurationEstimator(os.path.join(cache_dir, 'calibration.json') if cache_dir else None)
+        self.estimator = estimator
+
+    def cache_key(self, text):
+        """Content hash of the text and every voice parameter that affects the audio"""
+        params = [text, self.language_code, self.voice_name, self.ssml_gender_name, self.speaking_rate, self.pitch]
+        return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def cache_path(self, text):
+        if not self.cache_dir:
+            return None
+        key = self.cache_key(text)
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp3")
+
+    def estimate_duration(self, text):
+        """Predicted duration in seconds of text spoken with this voice, without synthesizing it"""
+        return self.estimator.estimate(text, self.voice_key, self.speaking_rate)
+
+    def synthesize(self, text):
+        """Call the synthesis backend and return raw MP3 bytes"""
+        return self.backend.synthesize(text, self.voice)
 
     def text_to_speech(self, text, filename='output.mp3'):
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+        with Instrumentation.span('tts', chars=len(text)) as span:
+            return self._text_to_speech(text, filename, span)
 
-        # Voice selection
-        voice_params = {
-            'language_code': self.language_code,
-            'ssml_gender': self.ssml_gender
-        }
-        if self.voice_name:
-            voice_params['name'] = self.voice_name
+    def _text_to_speech(self, text, filename, span):
+        cached_path = self.cache_path(text)
+        hit = bool(cached_path) and os.path.exists(cached_path)
+        Instrumentation.cache('tts', hit)
+        span.set(cache_hit=hit)
+        if hit:
+            shutil.copyfile(cached_path, filename)
+            Instrumentation.file_written('tts', filename)
+            print(f'Audio file has been loaded from cache as {filename}.')
+            return filename
 
-        voice = texttospeech.VoiceSelectionParams(**voice_params)
+        audio_content = self.synthesize(text)
 
-        # Generating speech
-        response = self.client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=self.audio_config
-        )
+        # Storing in cache (atomic rename, so concurrent workers never see a partial file)
+        if cached_path:
+            write_atomic(cached_path, audio_content)
+            Instrumentation.bytes_written('tts_cache', len(audio_content))
 
         # Saving to file
         with open(filename, 'wb') as out:
-            out.write(response.audio_content)
+            out.write(audio_content)
             print(f'Audio file has been saved as {filename}.')
+        Instrumentation.bytes_written('tts', len(audio_content))
+
+        try:
+            self.estimator.record(text, audio_duration(filename), self.voice_key, self.speaking_rate)
+        except Exception as e:
+            print(f"Could not calibrate duration estimate from {filename}: {e}")
+        return filename
+
+    def synthesize_many(self, items, max_workers=None):
+        """
+        Synthesizes a batch of (text, filename) pairs concurrently with a bounded pool.
+        Identical texts in one batch are synthesized once. Returns the filenames in input order.
+        """
+        items = list(items)
+        first_filename = {}
+        duplicates = []
+        for text, filename in items:
+            if text in first_filename:
+                duplicates.append((first_filename[text], filename))
+            else:
+                first_filename[text] = filename
+
+        workers = max_workers or self.max_workers
+        with Instrumentation.span('tts_batch', items=len(items), unique=len(first_filename), workers=workers), \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(lambda pair: self.text_to_speech(*pair), first_filename.items()))
+
+        for source, filename in duplicates:
+            if source != filename:
+                shutil.copyfile(source, filename)
+        self.estimator.save()
+        return [filename for _, filename in items]
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+# Wrapped text ready to draw: the lines, their pixel widths and the height of the whole block
+TextBlock = namedtuple('TextBlock', ['lines', 'widths', 'line_height', 'height'])
+
+class FontMetrics:
+    """
+    Glyph advance table and word-width cache of one font. Every character is measured once
+    with FreeType, and every distinct word once from the table, so laying out a card costs
+    a few dictionary lookups per word.
+    """
+    def __init__(self, font):
+        self.font = font
+        ascent, descent = font.getmetrics()
+        self.line_height = ascent + descent
+        self.advances = {}
+        self.word_widths = {}
+        self.space_width = self.advance(' ')
+
+    def advance(self, char):
+        width = self.advances.get(char)
+        if width is None:
+            width = self.advances[char] = self.font.getlength(char)
+        return width
+
+    def word_width(self, word):
+        width = self.word_widths.get(word)
+        if width is None:
+            advances = self.advances
+            width = 0
+            for char in word:
+                advance = advances.get(char)
+                width += advance if advance is not None else self.advance(char)
+            self.word_widths[word] = width
+        return width
+
+    def split_word(self, word, max_width):
+        """Break a word wider than max_width into pieces that each fit, one character at a time"""
+        pieces = []
+        start, width = 0, 0
+        for idx, char in enumerate(word):
+            advance = self.advance(char)
+            if width + advance > max_width and idx > start:
+                pieces.append(word[start:idx])
+                start, width = idx, 0
+            width += advance
+        pieces.append(word[start:])
+        return pieces
+
+    def wrap(self, text, max_width):
+        """
+        Greedy single-pass wrap of text to max_width pixels. Whitespace is collapsed like
+        textwrap.fill does, and words wider than a line are broken. Always returns at least one line.
+        """
+        lines, widths = [], []
+        line, line_width = [], 0
+        space = self.space_width
+        for word in text.split():
+            width = self.word_width(word)
+            if line and line_width + space + width <= max_width:
+                line.append(word)
+                line_width += space + width
+                continue
+            if line:
+                lines.append(' '.join(line))
+                widths.append(line_width)
+            if width <= max_width:
+                line, line_width = [word], width
+                continue
+            pieces = self.split_word(word, max_width)
+            for piece in pieces[:-1]:
+                lines.append(piece)
+                widths.append(self.word_width(piece))
+            line = [pieces[-1]]
+            line_width = self.word_width(pieces[-1])
+        if line or not lines:
+            lines.append(' '.join(line))
+            widths.append(line_width)
+        return TextBlock(lines, widths, self.line_height, self.line_height * len(lines))
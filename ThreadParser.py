@@ -0,0 +1,108 @@
+import json
+
+try:
+    import ijson
+except ImportError:  # Optional: without ijson the whole document is loaded, then reduced to records
+    ijson = None
+
+# parse_thread() says once per process that it is not streaming
+_warned_no_ijson = False
+
+class ThreadRecord:
+    """The fields of a thread post the pipeline uses"""
+    __slots__ = ('title', 'selftext', 'author', 'subreddit', 'ups', 'downs', 'num_comments', 'name')
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+class CommentRecord:
+    """The fields of a comment the pipeline uses; get() lets it stand in for a comment data dict"""
+    __slots__ = ('body', 'author', 'ups', 'downs', 'depth')
+
+    def __init__(self, depth=0):
+        self.body = None
+        self.author = None
+        self.ups = None
+        self.downs = None
+        self.depth = depth
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+_COMMENT_FIELDS = frozenset(CommentRecord.__slots__) - {'depth'}
+
+class ParsedThread:
+    """Compact result of parsing a thread: the post, comments in tree order and unexpanded "more" stubs"""
+    __slots__ = ('thread', 'comments', 'more_stubs')
+
+    def __init__(self, thread, comments, more_stubs):
+        self.thread = thread
+        self.comments = comments
+        # (children ids, depth) of every "more" stub
+        self.more_stubs = more_stubs
+
+def parse_thread(fp):
+    """
+    Parses a Reddit thread JSON document from a binary file object into compact records.
+    With ijson installed the document is streamed one top-level thing at a time, so peak
+    memory stays proportional to the kept fields rather than to the whole payload.
+    """
+    if ijson is None:
+        global _warned_no_ijson
+        if not _warned_no_ijson:
+            _warned_no_ijson = True
+            print("ijson is not installed, so the thread JSON is loaded whole instead of streamed (pip install ijson).")
+        return parse_thread_data(json.load(fp))
+
+    builder = _RecordBuilder()
+    # The post and every top-level comment share this prefix; the post is the only 't3'
+    for thing in ijson.items(fp, 'item.data.children.item', use_float=True):
+        if thing.get('kind') == 't3':
+            builder.add_post(thing['data'])
+        else:
+            builder.add_things([thing], 0)
+    return builder.result()
+
+def parse_thread_data(thread_data):
+    """Reduces an already loaded thread JSON document to the same compact records"""
+    builder = _RecordBuilder()
+    builder.add_post(thread_data[0]['data']['children'][0]['data'])
+    builder.add_things(thread_data[1]['data']['children'], 0)
+    return builder.result()
+
+class _RecordBuilder:
+    def __init__(self):
+        self.thread = None
+        self.comments = []
+        self.more_stubs = []
+
+    def add_post(self, post):
+        if self.thread is None:
+            self.thread = ThreadRecord()
+            for field in ThreadRecord.__slots__:
+                setattr(self.thread, field, post.get(field))
+
+    def add_things(self, children, depth):
+        for child in children:
+            data = child['data']
+            if child['kind'] == 'more':
+                self.more_stubs.append((data.get('children') or [], depth))
+            elif child['kind'] == 't1':
+                record = CommentRecord(depth)
+                for field in _COMMENT_FIELDS:
+                    setattr(record, field, data.get(field))
+                self.comments.append(record)
+                replies = data.get('replies')
+                if isinstance(replies, dict):
+                    self.add_things(replies['data']['children'], depth + 1)
+
+    def result(self):
+        if self.thread is None:
+            raise Exception("Thread JSON does not contain a post")
+        return ParsedThread(self.thread, self.comments, self.more_stubs)
@@ -1,124 +1,571 @@
-from moviepy import VideoFileClip, AudioFileClip, ImageClip, CompositeVideoClip, concatenate_videoclips
+from BackgroundIndex import BackgroundIndex, keyframe_start
+from MediaProbe import audio_duration
+import Instrumentation
+from collections import namedtuple
+import hashlib
+import json
 import os
 import random
+import re
+import shutil
+import subprocess
+import tempfile
+
+RENDER_BACKENDS = ('moviepy', 'ffmpeg')
+
+# One image shown while one audio file plays, placed on the output timeline
+Segment = namedtuple('Segment', ['audio_path', 'image_path', 'start', 'duration'])
+
+# Settings every segment of one render is encoded with; part of the segment cache key
+ENCODER_SETTINGS = {'fps': 30, 'codec': 'libx264', 'pix_fmt': 'yuv420p', 'audio_codec': 'aac'}
+
+# x264 preset, constant rate factor and thread count (0 = automatic) of one output, plus the
+# frame size it is scaled and center-cropped to; width and height None keep the background's size
+EncodeProfile = namedtuple('EncodeProfile', ['name', 'width', 'height', 'preset', 'crf', 'threads'])
+
+# Named on purpose instead of taken from the machine, so a profile encodes the same way everywhere
+# (byte-identical only with a fixed thread count, since x264's output depends on it).
+# 'default' matches the libx264 defaults that were used before profiles existed
+ENCODE_PROFILES = {
+    'default': EncodeProfile('default', None, None, 'medium', 23, 0),
+    '1080x1920': EncodeProfile('1080x1920', 1080, 1920, 'medium', 20, 0),
+    '720x1280': EncodeProfile('720x1280', 720, 1280, 'fast', 23, 0),
+    'draft': EncodeProfile('draft', None, None, 'ultrafast', 30, 0),
+}
+
+def encode_profiles(names, preset=None, crf=None, threads=None):
+    """Profiles for the given names in order, with preset, CRF and threads overridden where given"""
+    if isinstance(names, str):
+        names = [names]
+    profiles = []
+    for name in dict.fromkeys(names or ['default']):
+        if name not in ENCODE_PROFILES:
+            raise ValueError(f"Unknown encode profile: {name}. Expected one of {tuple(ENCODE_PROFILES)}.")
+        overrides = {key: value for key, value in (('preset', preset), ('crf', crf), ('threads', threads)) if value is not None}
+        profiles.append(ENCODE_PROFILES[name]._replace(**overrides))
+    return profiles
+
+def variant_output_paths(output_video_path, profiles):
+    """Output path of every profile: output_video_path for the first, output_<name>.mp4 beside it for the rest"""
+    root, ext = os.path.splitext(output_video_path)
+    return [output_video_path] + [f"{root}_{profile.name}{ext or '.mp4'}" for profile in profiles[1:]]
+
+def fit_filter(profile):
+    """ffmpeg filter that scales to cover the profile's frame and crops the overflow, or None to keep the size"""
+    if not profile.width or not profile.height:
+        return None
+    return (f"scale={profile.width}:{profile.height}:force_original_aspect_ratio=increase,"
+            f"crop={profile.width}:{profile.height},setsar=1")
+
+def variant_filters(video_label, audio_label, profiles):
+    """
+    Filters that fan one composited stream out to every profile: split once, then scale and
+    crop each copy. Returns the filters and a (video, audio) output label pair per profile.
+    With audio_label None only the video is split and every audio label is None.
+    """
+    count = len(profiles)
+    filters = []
+    if count > 1:
+        video_labels = [f"[vs{idx}]" for idx in range(count)]
+        filters.append(f"{video_label}split={count}{''.join(video_labels)}")
+        audio_labels = [None] * count
+        if audio_label:
+            audio_labels = [f"[as{idx}]" for idx in range(count)]
+            filters.append(f"{audio_label}asplit={count}{''.join(audio_labels)}")
+    else:
+        video_labels, audio_labels = [video_label], [audio_label]
+    outputs = []
+    for idx, profile in enumerate(profiles):
+        video_out = video_labels[idx]
+        fit = fit_filter(profile)
+        if fit:
+            video_out = f"[vout{idx}]"
+            filters.append(f"{video_labels[idx]}{fit}{video_out}")
+        outputs.append((video_out, audio_labels[idx]))
+    return filters, outputs
+
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def concat_segments(segment_paths, output_path):
+    """Join identically encoded video files with the concat demuxer, without re-encoding"""
+    list_fd, list_path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(list_fd, 'w', encoding='utf-8') as list_file:
+            for path in segment_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                list_file.write(f"file '{escaped}'\n")
+        with Instrumentation.span('concat', segments=len(segment_paths)):
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                            '-i', list_path, '-c', 'copy', output_path], check=True)
+    finally:
+        os.remove(list_path)
 
 class VideoEditService:
-    def __init__(self, input_video_path, output_video_path, images_folder='output_images', audio_folder='output_audio'):
+    def __init__(self, input_video_path, output_video_path, images_folder='output_images', audio_folder='output_audio', backend='moviepy',
+                 streaming=False, debug_audio=False, segment_cache_dir=None, seed=None, manifest=None, profiles=None):
+        if backend not in RENDER_BACKENDS:
+            raise ValueError(f"Unknown render backend: {backend}. Expected one of {RENDER_BACKENDS}.")
+        # A single video, or a folder of videos to pick the background from
         self.input_video_path = input_video_path
+        # The video chosen by select_background(); equal to input_video_path when that is a file
+        self.background_path = input_video_path
         self.output_video_path = output_video_path
         self.images_folder = images_folder
         self.audio_folder = audio_folder
+        # Ordered ManifestEntry list from the run's Workspace; without one the folders are scanned
+        self.manifest = manifest
+        self.backend = backend
+        # Encode segment by segment instead of holding every composited clip until the end
+        self.streaming = streaming
+        # Write debug_audio_output.mp3 next to the final render
+        self.debug_audio = debug_audio
+        # Encoded segments keyed by content; setting it implies streaming, since only segments can be reused
+        self.segment_cache_dir = segment_cache_dir
+        if segment_cache_dir:
+            self.streaming = True
+        # A fixed seed keeps the background choice stable between runs, which segment cache hits depend on
+        self.seed = seed
+        self.random = random.Random(seed)
+        # BackgroundClip chosen by select_background()
+        self.background_clip = None
+        # path -> content hash, so each input is hashed once per render
+        self._hashes = {}
+        # The first profile is written to output_video_path, every other one next to it with its name appended
+        self.profiles = profiles or encode_profiles(['default'])
+        self.profile = self.profiles[0]
 
-    def edit_video(self):
-        try:
-            # Download lists of audio and image files
-            audio_files = self.get_ordered_files(self.audio_folder, '.mp3')
-            image_files = self.get_ordered_files(self.images_folder, '.png')
+    def variant_path(self, profile):
+        return variant_output_paths(self.output_video_path, self.profiles)[self.profiles.index(profile)]
+
+    def encoder_settings(self, profile=None):
+        """ENCODER_SETTINGS combined with a profile; everything that changes the encoded bytes"""
+        profile = profile or self.profile
+        return {**ENCODER_SETTINGS, 'preset': profile.preset, 'crf': profile.crf, 'threads': profile.threads,
+                'width': profile.width, 'height': profile.height}
+
+    def select_background(self, segment_durations):
+        """
+        Picks the background video and a keyframe-aligned start offset from the persistent
+        background index, without opening or probing the videos themselves. Returns None as
+        the offset when segments pick their own slices.
+        """
+        index = BackgroundIndex.for_path(self.input_video_path)
+        if self.segment_cache_dir:
+            # Each segment takes its own slice (see segment_source_start), so the background only has to
+            # fit the longest segment and no offset depends on the length of the whole video
+            clip = index.choose_clip(self.input_video_path, max(segment_durations, default=0), self.random)
+            start_time = None
+        else:
+            clip, start_time = index.choose(self.input_video_path, sum(segment_durations), self.random)
+        self.background_path = clip.path
+        self.background_clip = clip
+        print(f"Background video: {clip.path} ({clip.duration} seconds, {clip.width}x{clip.height} at {clip.fps:g} fps)")
+        if start_time is not None:
+            print(f"Selected video segment: {start_time} to {start_time + sum(segment_durations)} seconds")
+        return start_time
+
+    def content_hash(self, path):
+        if path not in self._hashes:
+            self._hashes[path] = file_hash(path)
+        return self._hashes[path]
+
+    def segment_source_start(self, segment, start_time):
+        """
+        Background position the segment's slice starts at. Continuous renders play the background
+        straight through from start_time. With a segment cache, the slice is picked from the seed
+        and the segment's own card and audio, so editing, adding or reordering other comments
+        never moves it, and its cache key stays the same.
+        """
+        if not self.segment_cache_dir:
+            return start_time + segment.start
+        key = f"{self.seed}:{self.content_hash(segment.image_path)}:{self.content_hash(segment.audio_path)}"
+        return keyframe_start(self.background_clip, segment.duration, random.Random(key))
 
-            if len(audio_files) != len(image_files):
-                raise ValueError("Amount of audio files and images is not the same.")
+    def edit_video(self):
+        with Instrumentation.span('edit_video', backend=self.backend, streaming=self.streaming):
+            if self.backend == 'ffmpeg':
+                self.edit_video_ffmpeg()
+            else:
+                self.edit_video_moviepy()
+        for profile in self.profiles:
+            Instrumentation.file_written('video', self.variant_path(profile))
 
+    def edit_video_moviepy(self):
+        """Composite every segment in MoviePy, either concatenated in memory or streamed segment by segment"""
+        # MoviePy is imported only by the backend that uses it; it takes seconds to load
+        from moviepy import VideoFileClip
+        try:
+            # Probe every audio file once and lay the segments out on the timeline
+            timeline = self.build_timeline()
+            total_audio_duration = sum(segment.duration for segment in timeline)
 
-            # Caldulate total audio duration
-            total_audio_duration = self.get_total_audio_duration(audio_files)
+            # Cut a random video fragment of the appropriate length, starting on a keyframe
+            start_time = self.select_background([segment.duration for segment in timeline])
 
             # Load the original video
-            original_video = VideoFileClip(self.input_video_path)
-            print(f"Original video duration: {original_video.duration} seconds")
+            original_video = VideoFileClip(self.background_path)
 
-            if original_video.duration < total_audio_duration:
-                raise ValueError("Length of video is shorter than total audio duration.")
+            if self.streaming:
+                self.render_streaming(timeline, start_time,
+                                      lambda segment, source_start, path: self.write_moviepy_segment(original_video, segment, source_start, path))
+            else:
+                self.render_concatenated(original_video, timeline, start_time, start_time + total_audio_duration)
 
-            # Cut a random video fragment of the appropriate length
-            max_start_time = original_video.duration - total_audio_duration
-            start_time = random.uniform(0, max(0, max_start_time))
-            end_time = start_time + total_audio_duration
+            # Release resources
+            original_video.close()
+            print("Processing completed successfully.")
 
-            # Cut a video fragment
-            video_clip = original_video.with_subclip(start_time, end_time)
-            print(f"Selected video segment: {start_time} to {end_time} seconds")
+        except Exception as e:
+            print(f"Unexpected error: {e}")
 
-            # List of clips with images and audio overlaid
-            clips = []
-            current_time = 0
+    def compose_segment(self, source_clip, segment, offset=0):
+        """Overlay the segment's image on its slice of source_clip and attach its audio"""
+        from moviepy import AudioFileClip, ImageClip, CompositeVideoClip
+        audio_file, image_file = segment.audio_path, segment.image_path
+        print(f"Processing audio: {audio_file}, image: {image_file}")
+        print(f"Audio duration: {segment.duration} seconds")
 
-            for idx, (audio_file, image_file) in enumerate(zip(audio_files, image_files)):
-                try:
-                    print(f"Processing audio: {audio_file}, image: {image_file}")
+        # Check if audio is valid
+        if segment.duration <= 0:
+            raise ValueError(f"Invalid audio file: {audio_file}")
 
-                    # Read audio file and get its duration
-                    audio_clip = AudioFileClip(os.path.join(self.audio_folder, audio_file))
-                    audio_duration = audio_clip.duration
-                    print(f"Audio duration: {audio_duration} seconds")
+        audio_clip = AudioFileClip(audio_file)
 
-                    # Check if audio is valid
-                    if audio_clip is None or audio_duration <= 0:
-                        raise ValueError(f"Invalid audio file: {audio_file}")
+        # Cut a video fragment corresponding to the length of the audio
+        start = offset + segment.start
+        sub_video_clip = source_clip.with_subclip(start, start + segment.duration)
+        print(f"Sub-video segment: {start} to {start + segment.duration} seconds")
 
-                    # Cut a video fragment corresponding to the length of the audio
-                    sub_video_clip = video_clip.with_subclip(current_time, current_time + audio_duration)
-                    print(f"Sub-video segment: {current_time} to {current_time + audio_duration} seconds")
+        # Create an image as a clip
+        image_clip = ImageClip(image_file).with_duration(segment.duration)
+        image_clip = image_clip.with_position(("center", "center"))
+        # .resized(height=200)  # Optional: resize the image
 
-                    # Create an image as a clip
-                    image_clip = ImageClip(os.path.join(self.images_folder, image_file)).with_duration(audio_duration)
-                    image_clip = image_clip.with_position(("center", "center"))
-                    # .resized(height=200)  # Optional: resize the image
+        # Overlaying an image on a video; MoviePy only builds the frames while encoding, so their
+        # cost is part of the 'encode' span, as it is inside the ffmpeg filter graph
+        video_with_image = CompositeVideoClip([sub_video_clip, image_clip])
 
-                    # Overlaying an image on a video
-                    video_with_image = CompositeVideoClip([sub_video_clip, image_clip])
+        # Add audio to the clip
+        video_with_image = video_with_image.with_audio(audio_clip)
 
-                    # Add audio to the clip
-                    video_with_image = video_with_image.with_audio(audio_clip)
+        # Check if clip is valid
+        if video_with_image is None:
+            raise ValueError(f"Generated clip is None for audio {audio_file} and image {image_file}")
+        return video_with_image
 
-                    # Check if clip is valid
-                    if video_with_image is None:
-                        raise ValueError(f"Generated clip is None for audio {audio_file} and image {image_file}")
+    def render_concatenated(self, original_video, timeline, start_time, end_time):
+        """Composite all segments, concatenate them and encode the result in one write"""
+        from moviepy import concatenate_videoclips
+        # Cut a video fragment
+        video_clip = original_video.with_subclip(start_time, end_time)
 
-                    # Add clip to list
-                    clips.append(video_with_image)
+        # List of clips with images and audio overlaid
+        clips = []
 
-                    current_time += audio_duration
-                except Exception as e:
-                    print(f"Error processing audio {audio_file} and image {image_file}: {e}")
+        for segment in timeline:
+            try:
+                clips.append(self.compose_segment(video_clip, segment))
+            except Exception as e:
+                print(f"Error processing audio {segment.audio_path} and image {segment.image_path}: {e}")
 
-            # translate: "Concatenating clips"
-            print("Łączenie klipów...")
-            final_video = concatenate_videoclips(clips, method="compose").with_fps(30)
+        # translate: "Concatenating clips"
+        print("Łączenie klipów...")
+        final_video = concatenate_videoclips(clips, method="compose").with_fps(ENCODER_SETTINGS['fps'])
 
-            # Check if final_video is valid
-            if final_video is None:
-                raise ValueError("Final video is None after concatenation")
+        # Check if final_video is valid
+        if final_video is None:
+            raise ValueError("Final video is None after concatenation")
 
-            # Save audio path for debugging
+        # Save audio path for debugging
+        if self.debug_audio:
             print("Saving audio path...")
             final_video.audio.write_audiofile("debug_audio_output.mp3")
 
-            # Save final video
-            print(f"Saving final video to file: {self.output_video_path}")
-            final_video.write_videofile(self.output_video_path, codec="libx264", audio_codec="aac")
+        # Save final video
+        print(f"Saving final video to file: {self.output_video_path}")
+        self.write_moviepy_clip(final_video, [(profile, self.variant_path(profile)) for profile in self.profiles])
 
-            # Release resources
-            original_video.close()
+    def write_moviepy_segment(self, original_video, segment, source_start, outputs):
+        """Composite and encode one segment with MoviePy, releasing its audio reader afterwards"""
+        clip = self.compose_segment(original_video, segment, offset=source_start - segment.start)
+        try:
+            self.write_moviepy_clip(clip.with_fps(ENCODER_SETTINGS['fps']), outputs, logger=None)
+        finally:
+            # Only the segment's own audio reader is closed; the background reader is shared
+            if clip.audio is not None:
+                clip.audio.close()
+
+    def write_moviepy_clip(self, clip, outputs, **write_args):
+        """
+        Encodes a composited clip to every (profile, path) in outputs. A single output is written
+        directly. Several go through one lossless intermediate that transcode_variants() splits,
+        so MoviePy composites once and every profile is encoded from lossless frames.
+        """
+        if len(outputs) == 1:
+            profile, path = outputs[0]
+            with Instrumentation.span('encode', backend='moviepy', duration=clip.duration, **self.encoder_settings(profile)):
+                clip.write_videofile(path, **self.moviepy_write_args(profile), **write_args)
+            return
+        fd, intermediate_path = tempfile.mkstemp(suffix='.mp4', dir=os.path.dirname(os.path.abspath(outputs[0][1])))
+        os.close(fd)
+        try:
+            with Instrumentation.span('encode', backend='moviepy', duration=clip.duration, lossless=True):
+                clip.write_videofile(intermediate_path, **self.moviepy_write_args(lossless=True), **write_args)
+            self.transcode_variants(intermediate_path, outputs)
+        finally:
+            os.remove(intermediate_path)
+
+    def segment_cache_path(self, segment, source_start, profile):
+        """Cache location for a segment encoded with profile, or None when the segment cache is disabled"""
+        if not self.segment_cache_dir:
+            return None
+        background = os.stat(self.background_path)
+        key_data = {
+            'image': self.content_hash(segment.image_path),
+            'audio': self.content_hash(segment.audio_path),
+            'background': [os.path.abspath(self.background_path), background.st_size, background.st_mtime_ns],
+            'offset': round(source_start, 3),
+            'duration': round(segment.duration, 3),
+            'backend': self.backend,
+            'encoder': self.encoder_settings(profile)
+        }
+        key = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.segment_cache_dir, key[:2], f"{key}.mp4")
+
+    def render_streaming(self, timeline, start_time, encode_segment):
+        """
+        Encodes each segment as soon as it is composited, with encode_segment(segment, source_start,
+        outputs) writing one file per (profile, path) in outputs, and joins each profile's files
+        with the concat demuxer without re-encoding. Peak memory no longer grows with the number
+        of segments. With a segment cache, unchanged segments are taken from the cache instead of
+        being encoded again.
+        """
+        output_dir = os.path.dirname(os.path.abspath(self.output_video_path))
+        segment_dir = tempfile.mkdtemp(prefix='segments_', dir=output_dir)
+        try:
+            # Segment files of every profile, in timeline order
+            segment_paths = [[] for _ in self.profiles]
+            for idx, segment in enumerate(timeline):
+                source_start = self.segment_source_start(segment, start_time)
+                paths, outputs, cached_paths = [], [], {}
+                for profile_idx, profile in enumerate(self.profiles):
+                    cached_path = self.segment_cache_path(segment, source_start, profile)
+                    if cached_path:
+                        Instrumentation.cache('segment', os.path.exists(cached_path))
+                    if cached_path and os.path.exists(cached_path):
+                        print(f"Reusing cached {profile.name} segment for {segment.audio_path}: {cached_path}")
+                        paths.append(cached_path)
+                        continue
+                    segment_path = os.path.join(segment_dir, f"segment{idx:05d}_{profile_idx}.mp4")
+                    paths.append(segment_path)
+                    outputs.append((profile, segment_path))
+                    cached_paths[segment_path] = cached_path
+
+                if outputs:
+                    try:
+                        encode_segment(segment, source_start, outputs)
+                    except Exception as e:
+                        # Left out of every profile, so all variants keep the same segments
+                        print(f"Error processing audio {segment.audio_path} and image {segment.image_path}: {e}")
+                        continue
+
+                for _, segment_path in outputs:
+                    Instrumentation.file_written('segment', segment_path)
+                    cached_path = cached_paths[segment_path]
+                    if cached_path:
+                        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+                        partial_path = f"{cached_path}.{os.getpid()}.part"
+                        shutil.move(segment_path, partial_path)
+                        os.replace(partial_path, cached_path)
+                        paths[paths.index(segment_path)] = cached_path
+                for profile_idx, path in enumerate(paths):
+                    segment_paths[profile_idx].append(path)
+
+            if not segment_paths[0]:
+                raise ValueError("No segments were rendered")
+
+            for profile, paths in zip(self.profiles, segment_paths):
+                print(f"Saving final video to file: {self.variant_path(profile)}")
+                concat_segments(paths, self.variant_path(profile))
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+        if self.debug_audio:
+            self.dump_debug_audio()
+
+    def moviepy_write_args(self, profile=None, lossless=False):
+        """
+        write_videofile arguments for a profile; scaling and cropping are left to its ffmpeg writer.
+        The lossless variant keeps the composite's size for transcode_variants() to scale.
+        """
+        profile = profile or self.profile
+        if lossless:
+            return {'codec': ENCODER_SETTINGS['codec'], 'audio_codec': ENCODER_SETTINGS['audio_codec'], 'preset': 'ultrafast',
+                    'ffmpeg_params': ['-qp', '0']}
+        ffmpeg_params = ['-crf', str(profile.crf)]
+        fit = fit_filter(profile)
+        if fit:
+            ffmpeg_params += ['-vf', fit]
+        return {'codec': ENCODER_SETTINGS['codec'], 'audio_codec': ENCODER_SETTINGS['audio_codec'], 'preset': profile.preset,
+                'threads': profile.threads or None, 'ffmpeg_params': ffmpeg_params}
+
+    def transcode_variants(self, source_path, outputs):
+        """
+        Encodes a lossless intermediate into every (profile, path) in outputs in one ffmpeg run:
+        the source is decoded once, split, scaled per profile, and its audio is copied.
+        """
+        profiles = [profile for profile, _ in outputs]
+        # The audio is stream-copied, so only the video goes through the graph
+        filters, labels = variant_filters('[0:v]', None, profiles)
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path]
+        if filters:
+            command += ['-filter_complex', ';'.join(filters)]
+        for (profile, path), (video_label, _) in zip(outputs, labels):
+            # An input stream is mapped by specifier, a filter output by its label
+            video_map = '0:v' if video_label == '[0:v]' else video_label
+            command += ['-map', video_map, '-map', '0:a', *self.ffmpeg_encoder_args(profile, copy_audio=True), path]
+        with Instrumentation.span('encode', backend='ffmpeg', variants=len(outputs)):
+            subprocess.run(command, check=True)
+
+    def dump_debug_audio(self):
+        """Extract the final audio track to debug_audio_output.mp3"""
+        print("Saving audio path...")
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', self.output_video_path,
+                        '-vn', '-c:a', 'libmp3lame', 'debug_audio_output.mp3'], check=True)
+
+    def edit_video_ffmpeg(self):
+        """Trim, overlay and encode everything in a single ffmpeg invocation, or one per segment when streaming"""
+        try:
+            timeline = self.build_timeline()
+            total_audio_duration = sum(segment.duration for segment in timeline)
+
+            # A keyframe-aligned -ss lets ffmpeg start decoding exactly at the cut
+            start_time = self.select_background([segment.duration for segment in timeline])
+
+            if self.streaming:
+                self.render_streaming(timeline, start_time, self.encode_ffmpeg_segment)
+            else:
+                command = self.build_ffmpeg_command(timeline, start_time)
+                print(f"Saving final video to file: {self.output_video_path}")
+                # Compositing and encoding of every variant happen inside the one ffmpeg process
+                with Instrumentation.span('encode', backend='ffmpeg', duration=total_audio_duration,
+                                          variants=len(self.profiles), **self.encoder_settings()):
+                    subprocess.run(command, check=True)
+                if self.debug_audio:
+                    self.dump_debug_audio()
             print("Processing completed successfully.")
 
         except Exception as e:
             print(f"Unexpected error: {e}")
 
-    def get_ordered_files(self, folder, extension):
-        """Download an ordered list of files with the given extension"""
-        files = [f for f in os.listdir(folder) if f.endswith(extension)]
-        files.sort()
-        return files
+    def build_ffmpeg_command(self, timeline, start_time):
+        """
+        Builds one ffmpeg command: the background is trimmed with -ss/-t, every image is
+        overlaid centered while its audio plays, and the audio tracks are concatenated.
+        The result is decoded and composited once and split into one output per profile.
+        """
+        total_duration = sum(segment.duration for segment in timeline)
+        segment_count = len(timeline)
+
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-ss', f"{start_time:.3f}", '-t', f"{total_duration:.3f}", '-i', self.background_path]
+        for segment in timeline:
+            command += ['-i', segment.image_path]
+        for segment in timeline:
+            command += ['-i', segment.audio_path]
 
-    def get_total_audio_duration(self, audio_files):
-        """Calculate the total duration of audio"""
-        total_duration = 0
-        for audio_file in audio_files:
+        filters = []
+        previous_label = '[0:v]'
+        for idx, segment in enumerate(timeline):
+            label = f"[v{idx + 1}]"
+            filters.append(
+                f"{previous_label}[{idx + 1}:v]overlay=(W-w)/2:(H-h)/2:"
+                f"enable='between(t,{segment.start:.3f},{segment.start + segment.duration:.3f})'{label}"
+            )
+            previous_label = label
+
+        audio_labels = ''.join(f"[{segment_count + idx + 1}:a]" for idx in range(segment_count))
+        filters.append(f"{audio_labels}concat=n={segment_count}:v=0:a=1[aout]")
+        split_filters, outputs = variant_filters(previous_label, '[aout]', self.profiles)
+
+        command += ['-filter_complex', ';'.join(filters + split_filters)]
+        for profile, (video_label, audio_label) in zip(self.profiles, outputs):
+            command += ['-map', video_label, '-map', audio_label, *self.ffmpeg_encoder_args(profile),
+                        '-t', f"{total_duration:.3f}", self.variant_path(profile)]
+        return command
+
+    def encode_ffmpeg_segment(self, segment, source_start, outputs):
+        with Instrumentation.span('encode', backend='ffmpeg', duration=segment.duration, variants=len(outputs),
+                                  **self.encoder_settings(outputs[0][0])):
+            subprocess.run(self.build_ffmpeg_segment_command(segment, source_start, outputs), check=True)
+
+    def build_ffmpeg_segment_command(self, segment, source_start, outputs):
+        """
+        ffmpeg command that renders a single segment, for streaming and cached renders. The segment
+        is composited once and split into one file per (profile, path) in outputs.
+        """
+        filters, labels = variant_filters('[v]', None, [profile for profile, _ in outputs])
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-ss', f"{source_start:.3f}", '-t', f"{segment.duration:.3f}", '-i', self.background_path,
+                   '-i', segment.image_path, '-i', segment.audio_path,
+                   '-filter_complex', ';'.join(['[0:v][1:v]overlay=(W-w)/2:(H-h)/2[v]'] + filters)]
+        for (profile, path), (video_label, _) in zip(outputs, labels):
+            command += ['-map', video_label, '-map', '2:a', *self.ffmpeg_encoder_args(profile),
+                        '-t', f"{segment.duration:.3f}", path]
+        return command
+
+    def ffmpeg_encoder_args(self, profile=None, copy_audio=False):
+        """Output options of one profile: the shared ENCODER_SETTINGS plus its preset, CRF and threads"""
+        profile = profile or self.profile
+        args = ['-r', str(ENCODER_SETTINGS['fps']), '-c:v', ENCODER_SETTINGS['codec'],
+                '-preset', profile.preset, '-crf', str(profile.crf),
+                '-pix_fmt', ENCODER_SETTINGS['pix_fmt'], '-c:a', 'copy' if copy_audio else ENCODER_SETTINGS['audio_codec']]
+        if profile.threads:
+            args += ['-threads', str(profile.threads)]
+        return args
+
+    def build_timeline(self):
+        """Place the manifest's segments, or paired audio and image files, back to back using header-probed durations"""
+        with Instrumentation.span('timeline'):
+            return self._build_timeline()
+
+    def _build_timeline(self):
+        if self.manifest is not None:
+            timeline = []
+            current_time = 0
+            for entry in self.manifest:
+                timeline.append(Segment(entry.audio_path, entry.image_path, current_time, entry.duration))
+                current_time += entry.duration
+            return timeline
+
+        audio_files = self.get_ordered_files(self.audio_folder, '.mp3')
+        image_files = self.get_ordered_files(self.images_folder, '.png')
+
+        if len(audio_files) != len(image_files):
+            raise ValueError("Amount of audio files and images is not the same.")
+
+        timeline = []
+        current_time = 0
+        for audio_file, image_file in zip(audio_files, image_files):
+            audio_path = os.path.join(self.audio_folder, audio_file)
             try:
-                audio_clip = AudioFileClip(os.path.join(self.audio_folder, audio_file))
-                if audio_clip is not None:
-                    total_duration += audio_clip.duration
-                audio_clip.close()
+                duration = audio_duration(audio_path)
             except Exception as e:
                 print(f"Error while reading audio file {audio_file}: {e}")
-        return total_duration
\ No newline at end of file
+                continue
+            timeline.append(Segment(audio_path, os.path.join(self.images_folder, image_file), current_time, duration))
+            current_time += duration
+        return timeline
+
+    def get_ordered_files(self, folder, extension):
+        """Download an ordered list of files with the given extension, numbers compared by value (comment2 before comment10)"""
+        files = [f for f in os.listdir(folder) if f.endswith(extension)]
+        files.sort(key=lambda name: [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)])
+        return files
+
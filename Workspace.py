@@ -0,0 +1,81 @@
+from MediaProbe import audio_duration
+from collections import namedtuple
+import json
+import os
+import shutil
+import tempfile
+
+# One video segment in playback order: the card shown while the audio plays, duration in seconds
+ManifestEntry = namedtuple('ManifestEntry', ['audio_path', 'image_path', 'duration'])
+
+# RAM-backed filesystem used for --tmpfsWorkspace where the platform has one
+TMPFS_ROOT = '/dev/shm'
+
+class Workspace:
+    """
+    Files of one pipeline run: its synthesized audio, rendered cards and the ordered segment
+    manifest that ties them together. Every run gets its own directory, so concurrent runs never
+    touch each other's files, and the video stage reads the manifest instead of listing folders.
+    """
+    def __init__(self, root=None, audio_folder=None, images_folder=None, tmpfs=False, keep=False):
+        if root is None and tmpfs:
+            if os.path.isdir(TMPFS_ROOT):
+                root = TMPFS_ROOT
+            else:
+                print(f"{TMPFS_ROOT} is not available, using the default temporary folder for the workspace.")
+        if root:
+            os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix='run_', dir=root)
+        # Explicit folders keep the files somewhere inspectable; the manifest still decides what is used
+        self.audio_folder = audio_folder or os.path.join(self.path, 'audio')
+        self.images_folder = images_folder or os.path.join(self.path, 'images')
+        os.makedirs(self.audio_folder, exist_ok=True)
+        os.makedirs(self.images_folder, exist_ok=True)
+        self.keep = keep
+        self.manifest = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    def audio_path(self, index):
+        return os.path.join(self.audio_folder, f"comment{index}.mp3")
+
+    def image_path(self, index):
+        return os.path.join(self.images_folder, f"comment{index}.png")
+
+    def build_manifest(self, audio_paths, image_paths):
+        """
+        Pairs the audio and card of every segment in order and records the audio's duration.
+        Segments whose audio or card failed are left out with a message, instead of shifting
+        every later card onto the wrong audio.
+        """
+        if len(audio_paths) != len(image_paths):
+            raise ValueError("Amount of audio files and images is not the same.")
+        self.manifest = []
+        for index, (audio_path, image_path) in enumerate(zip(audio_paths, image_paths)):
+            if not audio_path or not image_path or not os.path.exists(audio_path) or not os.path.exists(image_path):
+                print(f"Skipping segment {index}: its audio or card was not produced.")
+                continue
+            try:
+                duration = audio_duration(audio_path)
+            except Exception as e:
+                print(f"Error while reading audio file {audio_path}: {e}")
+                continue
+            self.manifest.append(ManifestEntry(audio_path, image_path, duration))
+        self.save_manifest()
+        return self.manifest
+
+    def save_manifest(self):
+        with open(os.path.join(self.path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump([entry._asdict() for entry in self.manifest], f, indent=2)
+
+    def cleanup(self):
+        """Removes the run directory unless the workspace is kept for inspection"""
+        if self.keep:
+            print(f"Workspace kept at {self.path}.")
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
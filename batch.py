@@ -0,0 +1,250 @@
+import argparse
+import copy
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+import Instrumentation
+from main import build_parser, fetch_comments, create_http_service, create_duration_estimator, create_tts_client, create_image_service, create_workspace, synthesize_audio, render_cards, render_video
+
+class BatchJob:
+    """One video to produce, carried through every pipeline stage"""
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.info = None
+        self.comments = None
+        self.workspace = None
+        self.audio_paths = None
+        self.error = None
+        self.failed_stage = None
+        self.timings = {}
+
+    def report(self):
+        return {
+            'index': self.index,
+            'redditURL': self.args.redditURL,
+            'threadFile': self.args.threadFile,
+            'outputVideo': self.args.outputVideo,
+            'status': 'failed' if self.error else 'ok',
+            'failedStage': self.failed_stage,
+            'error': self.error,
+            'comments': len(self.comments) if self.comments is not None else None,
+            'seconds': self.timings
+        }
+
+def load_jobs(jobs_path, work_folder, output_folder):
+    """
+    Reads a plain list of Reddit URLs (one per line) or a JSONL job list whose objects use
+    main.py option names, e.g. {"redditURL": "...", "topComments": 3, "voice": "en-US-Casual-K"}.
+    Options that are not given fall back to main.py defaults.
+    """
+    parser = build_parser()
+    jobs = []
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            index = len(jobs)
+            try:
+                options = json.loads(line) if line.startswith('{') else {'redditURL': line}
+            except ValueError as e:
+                options = {'error': f"Invalid job line: {e}"}
+            args = parser.parse_args([])
+            # Every job gets its own workspace under the work folder, so jobs never overwrite each other's files
+            args.workspaceRoot = work_folder
+            args.outputVideo = os.path.join(output_folder, f"job{index:04d}.mp4")
+            job = BatchJob(index, args)
+            jobs.append(job)
+
+            error = apply_options(args, options)
+            if error:
+                # Invalid jobs are reported, not fatal for the rest of the batch
+                job.error, job.failed_stage = error, 'load'
+    return jobs
+
+def apply_options(args, options):
+    """Sets job options given by main.py option name on args; returns an error message for an invalid job"""
+    error = options.pop('error', None)
+    if not options.get('redditURL') and not options.get('threadFile'):
+        error = error or "Job has neither redditURL nor threadFile"
+    unknown = [key for key in options if not hasattr(args, key)]
+    if unknown:
+        error = f"Unknown options: {', '.join(unknown)}"
+    if error:
+        return error
+    for key, value in options.items():
+        setattr(args, key, value)
+    # There is nobody to answer the prompt in a batch
+    args.selectComments = False
+    return None
+
+class SharedResources:
+    """
+    Clients shared by every job of a process: one HTTP client, one duration estimator, one card
+    renderer and one TTS client per voice configuration. Its methods are the pipeline stages.
+    """
+    def __init__(self, card_workers=1, tts_backend=None):
+        default_args = build_parser().parse_args([])
+        self.http = create_http_service(default_args)
+        # One estimator, so calibration learned from every voice ends up in the same file
+        self.estimator = create_duration_estimator(default_args)
+        self.imageService = create_image_service()
+        # Cards are rendered in the calling thread by default; parallelism comes from running several jobs at once
+        self.card_workers = card_workers
+        # Synthesis backend behind every voice configuration's TTS client; Google TTS is created with the
+        # first client that needs it, and its gRPC channel only with the first synthesis
+        self.tts_backend = tts_backend
+        self.tts_clients = {}
+        self.tts_lock = threading.Lock()
+
+    def tts_client_for(self, args):
+        key = (args.language, args.voice, args.gender, args.rate, args.pitch, args.ttsCacheFolder, args.ttsWorkers)
+        with self.tts_lock:
+            if key not in self.tts_clients:
+                if self.tts_backend is None:
+                    from TTSService import GoogleTTSBackend
+                    self.tts_backend = GoogleTTSBackend()
+                self.tts_clients[key] = create_tts_client(args, backend=self.tts_backend, estimator=self.estimator)
+            return self.tts_clients[key]
+
+    def fetch(self, job):
+        job.info, job.comments = fetch_comments(job.args, http=self.http, estimator=self.estimator)
+        job.workspace = create_workspace(job.args)
+
+    def synthesize(self, job):
+        job.audio_paths = synthesize_audio(job.workspace, self.tts_client_for(job.args), job.info, job.comments)
+
+    def render_cards(self, job):
+        image_paths = render_cards(job.args, self.imageService, job.workspace, job.info, job.comments, workers=self.card_workers)
+        job.workspace.build_manifest(job.audio_paths, image_paths)
+
+    def encode(self, job):
+        from VideoEditService import encode_profiles, variant_output_paths
+        profiles = encode_profiles(job.args.encodeProfile)
+        folder, name = os.path.split(os.path.abspath(job.args.outputVideo))
+        os.makedirs(folder, exist_ok=True)
+        root, ext = os.path.splitext(name)
+        # Rendered under a temporary name and renamed once complete, so a video left by an
+        # earlier run is only replaced by a finished one and never passes for this job's output
+        render_args = copy.copy(job.args)
+        render_args.outputVideo = os.path.join(folder, f".{root}.{os.getpid()}-{job.index}.part{ext or '.mp4'}")
+        partial_paths = variant_output_paths(render_args.outputVideo, profiles)
+        try:
+            render_video(render_args, job.workspace.manifest)
+            if not all(os.path.exists(path) for path in partial_paths):
+                raise RuntimeError("Video was not written, see the log above")
+            for partial_path, output_path in zip(partial_paths, variant_output_paths(job.args.outputVideo, profiles)):
+                os.replace(partial_path, output_path)
+        finally:
+            for path in partial_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            # Free the workspace as soon as the video is done instead of when the whole batch is
+            self.finish(job)
+
+    def finish(self, job):
+        """Releases the job's workspace, whether or not every stage succeeded"""
+        if job.workspace is not None:
+            job.workspace.cleanup()
+            job.workspace = None
+
+    def stages(self):
+        return [('fetch', self.fetch), ('tts', self.synthesize), ('cards', self.render_cards), ('encode', self.encode)]
+
+def run_job_stage(name, func, job):
+    """Runs one stage for a job, recording its time and turning an exception into a job failure"""
+    if job.error is not None:
+        return
+    start = time.perf_counter()
+    try:
+        # Named apart from the fetch/tts/encode spans inside the stage, so the summary does not count them twice
+        with Instrumentation.span(f"stage.{name}", job=job.index):
+            func(job)
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        job.failed_stage = name
+        traceback.print_exc()
+    job.timings[name] = round(time.perf_counter() - start, 3)
+
+def run_stage(name, func, inbox, outbox):
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        run_job_stage(name, func, job)
+        outbox.put(job)
+
+def run_pipeline(jobs, stages):
+    """
+    Runs jobs through stages of (name, func, workers), each stage with its own thread pool
+    and queue, so a slow stage never blocks the others. A failing job skips the remaining
+    stages. Returns the jobs in completion order.
+    """
+    queues = [queue.Queue() for _ in range(len(stages) + 1)]
+    threads = []
+    for idx, (name, func, workers) in enumerate(stages):
+        stage_threads = [threading.Thread(target=run_stage, args=(name, func, queues[idx], queues[idx + 1]), daemon=True)
+                         for _ in range(max(1, workers))]
+        for thread in stage_threads:
+            thread.start()
+        threads.append(stage_threads)
+
+    for job in jobs:
+        queues[0].put(job)
+
+    # Shut the stages down in order once the previous one has drained
+    for idx, stage_threads in enumerate(threads):
+        for _ in stage_threads:
+            queues[idx].put(None)
+        for thread in stage_threads:
+            thread.join()
+
+    finished = []
+    while not queues[-1].empty():
+        finished.append(queues[-1].get())
+    return finished
+
+def main():
+    parser = argparse.ArgumentParser(description="Create videos for many Reddit threads in one run.")
+    parser.add_argument("--jobs", type=str, required=True, help="File with one Reddit URL per line, or a JSONL job list.")
+    parser.add_argument("--workFolder", type=str, default="./batch_work", help="Folder for per-job workspaces.")
+    parser.add_argument("--outputFolder", type=str, default="./final_output/batch", help="Folder for videos of jobs without outputVideo.")
+    parser.add_argument("--report", type=str, default="./final_output/batch_report.json", help="Path of the JSON batch report.")
+    parser.add_argument("--fetchWorkers", type=int, default=4, help="Concurrent Reddit fetches.")
+    parser.add_argument("--ttsWorkers", type=int, default=2, help="Jobs synthesizing audio at the same time.")
+    parser.add_argument("--imageWorkers", type=int, default=2, help="Jobs rendering cards at the same time.")
+    parser.add_argument("--encodeWorkers", type=int, default=1, help="Videos encoded at the same time.")
+    parser.add_argument("--trace", type=str, default=None, help="Write a JSON trace of stage timings, cache counters and peak memory to this file.")
+    parser.add_argument("--traceSummary", action="store_true", help="Print a table of stage timings and counters at the end of the batch.")
+    batch_args = parser.parse_args()
+    if batch_args.trace or batch_args.traceSummary:
+        Instrumentation.enable()
+
+    jobs = load_jobs(batch_args.jobs, batch_args.workFolder, batch_args.outputFolder)
+    print(f"Loaded {len(jobs)} jobs from {batch_args.jobs}.")
+
+    # Shared across all jobs: one HTTP client, one card renderer and one TTS client per voice configuration
+    shared = SharedResources()
+    workers = {'fetch': batch_args.fetchWorkers, 'tts': batch_args.ttsWorkers, 'cards': batch_args.imageWorkers,
+               'encode': batch_args.encodeWorkers}
+    finished = run_pipeline(jobs, [(name, func, workers[name]) for name, func in shared.stages()])
+    finished.sort(key=lambda job: job.index)
+    for job in finished:
+        shared.finish(job)
+
+    report = [job.report() for job in finished]
+    os.makedirs(os.path.dirname(os.path.abspath(batch_args.report)), exist_ok=True)
+    with open(batch_args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    failed = [job for job in finished if job.error]
+    print(f"Batch finished: {len(finished) - len(failed)} succeeded, {len(failed)} failed. Report saved as {batch_args.report}.")
+    Instrumentation.report(batch_args.trace, batch_args.traceSummary)
+
+if __name__ == "__main__":
+    main()
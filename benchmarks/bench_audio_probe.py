@@ -0,0 +1,52 @@
+"""
+Benchmark of audio duration probing for a folder of MP3s.
+
+Compares opening every file with MoviePy's AudioFileClip (how durations were read
+before MediaProbe) with MediaProbe's header parsing, cold and cached.
+
+    python benchmarks/bench_audio_probe.py output_audio
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import MediaProbe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio duration probing.")
+    parser.add_argument("folder", help="Folder with .mp3 files.")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.endswith('.mp3'))
+
+    from moviepy import AudioFileClip
+    start = time.perf_counter()
+    moviepy_total = 0
+    for path in paths:
+        clip = AudioFileClip(path)
+        moviepy_total += clip.duration
+        clip.close()
+    moviepy_seconds = time.perf_counter() - start
+
+    MediaProbe.clear_duration_cache()
+    start = time.perf_counter()
+    header_total = sum(MediaProbe.audio_duration(path) for path in paths)
+    cold_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sum(MediaProbe.audio_duration(path) for path in paths)
+    cached_seconds = time.perf_counter() - start
+
+    print(f"files:              {len(paths)}")
+    print(f"AudioFileClip:      {moviepy_seconds * 1000:10.2f} ms (total {moviepy_total:.2f} s of audio)")
+    print(f"header probe:       {cold_seconds * 1000:10.2f} ms (total {header_total:.2f} s of audio)")
+    print(f"header probe cache: {cached_seconds * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of comment filtering and ranking over a synthetic large thread.
+
+Compares the previous filter loop (one pass per call, ranking by API order only)
+with CommentFilter's single-pass filter and heap-based top-k selection.
+
+    python benchmarks/bench_comment_filter.py --comments 50000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CommentFilter import CommentFilter
+
+WORDS = "the a reddit cat dog yes no honestly because people really think about this every time".split()
+
+
+def synthetic_thread(count, seed=42):
+    """Thread JSON shaped like Reddit's, with a mix of short, long, removed and link comments"""
+    rng = random.Random(seed)
+    children = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.05:
+            body = "[removed]"
+        elif roll < 0.10:
+            body = "look at https://example.com/" + str(i)
+        else:
+            body = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 80)))
+        author = "AutoModerator" if roll > 0.99 else f"user{i}"
+        children.append({'kind': 't1', 'data': {'author': author, 'body': body, 'ups': rng.randint(0, 5000), 'downs': 0, 'replies': ''}})
+    return [{'data': {'children': [{'data': {'title': 'Synthetic thread', 'name': 't3_bench'}}]}},
+            {'data': {'children': children}}]
+
+
+def legacy_filter(comments, max_words_per_comment=30):
+    """The filter loop RedditAPIService.get_all_comments used before CommentFilter"""
+    all_comments = []
+    for comment in comments:
+        if comment['kind'] != 'more':
+            data = comment['data']
+            authorLowerCase = data.get('author', '').lower()
+            body = data.get('body', '')
+            if len(body.split()) > max_words_per_comment:
+                continue
+            if "moderator" in authorLowerCase or body in ["[removed]", "[deleted]"]:
+                continue
+            if "https://" in body or "http://" in body:
+                continue
+            all_comments.append({'author': data.get('author'), 'body': body, 'upvotes': data.get('ups'), 'downvotes': data.get('downs')})
+    return all_comments
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark comment filtering and ranking.")
+    parser.add_argument("--comments", type=int, default=50000, help="Number of synthetic comments.")
+    parser.add_argument("--top", type=int, default=10, help="k for top-k selection.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is reported).")
+    args = parser.parse_args()
+
+    thread = json.loads(json.dumps(synthetic_thread(args.comments)))
+    children = thread[1]['data']['children']
+    datas = [child['data'] for child in children]
+
+    legacy_seconds, legacy = timed(lambda: legacy_filter(children), args.repeat)
+    filter_seconds, filtered = timed(lambda: CommentFilter().filter(datas), args.repeat)
+    ups_seconds, _ = timed(lambda: CommentFilter(score='ups').top(datas, args.top), args.repeat)
+    length_seconds, _ = timed(lambda: CommentFilter(score='length').top(datas, args.top), args.repeat)
+    blocklist_seconds, _ = timed(lambda: CommentFilter(score='ups', blocklist=[r'\bcat\b', r'honestly']).top(datas, args.top), args.repeat)
+
+    assert len(legacy) == len(filtered), "CommentFilter must keep the same comments as the legacy loop"
+    print(f"comments:                    {args.comments} ({len(filtered)} pass the filter)")
+    print(f"legacy filter loop:          {legacy_seconds * 1000:8.2f} ms")
+    print(f"CommentFilter.filter:        {filter_seconds * 1000:8.2f} ms")
+    print(f"top {args.top:<3} by ups:              {ups_seconds * 1000:8.2f} ms")
+    print(f"top {args.top:<3} by length fit:       {length_seconds * 1000:8.2f} ms")
+    print(f"top {args.top:<3} by ups + blocklist:  {blocklist_seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Microbenchmark for ImageService.create_reddit_style_image.
+
+Compares cold rendering (asset cache cleared before every card, which matches the
+old behaviour of reloading the font and icons per card) with warm rendering,
+measures ImageService.render_batch() scaling across worker processes, and times
+pixel-width text layout against the old character-count textwrap.
+
+    python benchmarks/bench_image_cards.py --cards 200 --workers 1 2 4 --layouts 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import textwrap
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import ImageService as image_module
+from ImageService import ImageService
+
+SAMPLE_TEXTS = [
+    "Short one.",
+    "The best advice I ever got was to stop comparing my chapter one to someone else's chapter twenty.",
+    "My grandma used to say that if you can't fix it with duct tape you aren't using enough duct tape, and honestly she was right every time.",
+]
+
+
+def render_cards(service, count, output_dir, cold):
+    start = time.perf_counter()
+    for i in range(count):
+        if cold:
+            image_module.clear_asset_cache()
+            service.small_font = image_module.load_font(service.normal_font, service.small_font_size)
+        service.create_reddit_style_image(
+            SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)],
+            output_path=os.path.join(output_dir, f"card{i}.png"),
+            subreddit="AskReddit",
+            username=f"user{i}"
+        )
+    return count / (time.perf_counter() - start)
+
+
+def render_batch(service, count, output_dir, workers):
+    cards = [{
+        'text': SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)],
+        'output_path': os.path.join(output_dir, f"batch{i}.png"),
+        'subreddit': "AskReddit",
+        'username': f"user{i}"
+    } for i in range(count)]
+    start = time.perf_counter()
+    service.render_batch(cards, workers=workers)
+    return count / (time.perf_counter() - start)
+
+
+def layout_texts(service, count):
+    """Seconds to wrap count distinct texts with textwrap and with ImageService.layout_text()"""
+    texts = [f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]} #{i}" for i in range(count)]
+    start = time.perf_counter()
+    for text in texts:
+        textwrap.fill(text, width=45)
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    for text in texts:
+        service.layout_text(text)
+    return legacy, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Reddit card rendering.")
+    parser.add_argument("--cards", type=int, default=200, help="Number of cards to render per run.")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4], help="Worker counts for render_batch().")
+    parser.add_argument("--layouts", type=int, default=1000, help="Number of texts for the layout measurement.")
+    args = parser.parse_args()
+
+    service = ImageService()
+    with tempfile.TemporaryDirectory() as output_dir:
+        # Silence the per-card print while measuring
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            cold = render_cards(service, args.cards, output_dir, cold=True)
+            warm = render_cards(service, args.cards, output_dir, cold=False)
+            batch = {workers: render_batch(service, args.cards, output_dir, workers) for workers in args.workers}
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print(f"cold (no asset cache): {cold:8.1f} cards/sec")
+    print(f"warm (asset cache):    {warm:8.1f} cards/sec")
+    print(f"speedup:               {warm / cold:8.2f}x")
+    for workers, rate in batch.items():
+        print(f"render_batch workers={workers:<3} {rate:8.1f} cards/sec")
+    legacy_layout, layout = layout_texts(ImageService(), args.layouts)
+    print(f"textwrap.fill x{args.layouts}:   {legacy_layout * 1000:8.1f} ms")
+    print(f"layout_text x{args.layouts}:     {layout * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Reproducible, fully offline benchmark suite for the whole video pipeline.
+
+Uses the synthetic thread in benchmarks/fixtures/ (generated in Reddit's JSON layout, not
+recorded from reddit.com), a fake TTS backend that returns silent MP3s whose length is
+proportional to the text, and a generated background video, so no network access or
+credentials are needed. Times thread parsing and comment filtering,
+card rendering throughput, VideoEditService.edit_video per backend, and whole main.py
+runs. Results are stored in a JSON history keyed by git commit and compared with the
+previous commit's run.
+
+    python benchmarks/bench_pipeline.py --comments 5 20 50
+    python benchmarks/bench_pipeline.py --only parse cards --repeat 5
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from ImageService import ImageService
+from RedditAPIService import RedditAPIService
+from VideoEditService import RENDER_BACKENDS
+from fake_tts import FakeTTSBackend
+import main as pipeline
+
+FIXTURE = os.path.join('benchmarks', 'fixtures', 'askreddit_thread.json')
+BACKGROUND_CACHE = os.path.join('cache', 'bench')
+BENCHMARKS = ('parse', 'cards', 'edit', 'main')
+
+def ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', *args], check=True)
+
+
+def background_video(seconds):
+    """Generated 1080x1920 background, kept in cache/bench so it is only encoded once"""
+    path = os.path.join(BACKGROUND_CACHE, f"background_{seconds}s.mp4")
+    if not os.path.exists(path):
+        os.makedirs(BACKGROUND_CACHE, exist_ok=True)
+        print(f"Generating {seconds} second background video...")
+        ffmpeg('-f', 'lavfi', '-i', f"testsrc2=size=1080x1920:rate=30:duration={seconds}",
+               '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-pix_fmt', 'yuv420p', path)
+    return path
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def pipeline_argv(work_dir, comments, background, backend='moviepy'):
+    """main.py command line for an offline run over the fixture with every cache disabled"""
+    return [
+        '--threadFile', FIXTURE,
+        '--topComments', str(comments),
+        '--rankBy', 'ups',
+        '--commentDepth', '2',
+        '--language', 'en-US', '--voice', 'en-US-Casual-K', '--rate', '1.0',
+        '--inputVideo', background,
+        '--outputVideo', os.path.join(work_dir, f"output_{backend}.mp4"),
+        '--workspaceRoot', work_dir,
+        '--httpCacheFolder', '',
+        '--ttsCacheFolder', '',
+        '--renderBackend', backend,
+        '--seed', '1'
+    ]
+
+
+def pipeline_args(work_dir, comments, background, backend='moviepy'):
+    return pipeline.build_parser().parse_args(pipeline_argv(work_dir, comments, background, backend))
+
+
+def bench_parse(repeat, comments):
+    def parse_and_filter():
+        thread = RedditAPIService(FIXTURE)
+        thread.load_thread_file(FIXTURE)
+        thread.get_top_comments(n=max(comments), score='ups', max_depth=2)
+    seconds = best_of(parse_and_filter, repeat)
+    return [{'benchmark': 'parse', 'params': {'top': max(comments)}, 'seconds': seconds}]
+
+
+def bench_cards(repeat, work_dir):
+    thread = RedditAPIService(FIXTURE)
+    thread.load_thread_file(FIXTURE)
+    texts = [comment['body'] for comment in thread.get_all_comments(max_depth=2)]
+    service = ImageService()
+    output_path = os.path.join(work_dir, 'card.png')
+
+    def render_all():
+        for text in texts:
+            service.create_reddit_style_image(text, output_path, 'AskReddit', 'bench_user')
+    seconds = best_of(render_all, repeat)
+    return [{'benchmark': 'cards', 'params': {'cards': len(texts)}, 'seconds': seconds,
+             'cards_per_second': round(len(texts) / seconds, 1)}]
+
+
+def bench_edit(comment_counts, backends, background, work_dir):
+    results = []
+    for comments in comment_counts:
+        job_dir = os.path.join(work_dir, f"edit{comments}")
+        args = pipeline_args(job_dir, comments, background)
+        info, top_comments = pipeline.fetch_comments(args)
+        workspace = pipeline.create_workspace(args)
+        audio_paths = pipeline.synthesize_audio(workspace, pipeline.create_tts_client(args, backend=FakeTTSBackend()), info, top_comments)
+        image_paths = pipeline.render_cards(args, ImageService(), workspace, info, top_comments)
+        workspace.build_manifest(audio_paths, image_paths)
+        for backend in backends:
+            args = pipeline_args(job_dir, comments, background, backend)
+            start = time.perf_counter()
+            pipeline.render_video(args, workspace.manifest)
+            seconds = time.perf_counter() - start
+            if not os.path.exists(args.outputVideo):
+                raise RuntimeError(f"edit_video with the {backend} backend did not write {args.outputVideo}")
+            results.append({'benchmark': 'edit', 'params': {'comments': comments, 'backend': backend}, 'seconds': seconds})
+    return results
+
+
+def bench_main(comment_counts, backend, background, work_dir):
+    """Whole main.py runs, each in a fresh interpreter, so imports and other cold-start costs are included"""
+    env = dict(os.environ, TTS_BACKEND='fake_tts:FakeTTSBackend',
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.join(ROOT, 'benchmarks'), os.environ.get('PYTHONPATH')])))
+    results = []
+    for comments in comment_counts:
+        argv = pipeline_argv(os.path.join(work_dir, f"main{comments}"), comments, background, backend)
+        output_video = argv[argv.index('--outputVideo') + 1]
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'main.py', *argv], env=env, check=True, stdout=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        if not os.path.exists(output_video):
+            raise RuntimeError(f"main.py run with {comments} comments did not write {output_video}")
+        results.append({'benchmark': 'main', 'params': {'comments': comments, 'backend': backend, 'process': 'cold'},
+                        'seconds': seconds})
+    return results
+
+
+def result_key(result):
+    return result['benchmark'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+
+
+def print_results(results, baseline):
+    """Print this run's timings next to the previous commit's, when it measured the same thing"""
+    previous = {result_key(result): result['seconds'] for result in baseline['results']} if baseline else {}
+    header = f"vs {baseline['commit']}" if baseline else ''
+    print(f"\n{'benchmark':<50} {'seconds':>10} {header:>14}")
+    for result in results:
+        key = result_key(result)
+        line = f"{key:<50} {result['seconds']:>10.3f}"
+        if key in previous and previous[key] > 0:
+            line += f" {(result['seconds'] / previous[key] - 1) * 100:>+13.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the whole video pipeline.")
+    parser.add_argument("--comments", type=int, nargs="*", default=[5, 20, 50], help="Comment counts for the edit and main benchmarks.")
+    parser.add_argument("--only", nargs="*", choices=BENCHMARKS, default=list(BENCHMARKS), help="Benchmarks to run.")
+    parser.add_argument("--backends", nargs="*", default=list(RENDER_BACKENDS), help="Render backends for the edit benchmark.")
+    parser.add_argument("--mainBackend", type=str, default="ffmpeg", choices=RENDER_BACKENDS, help="Render backend for whole main.py runs.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parse/cards measurement (best is reported).")
+    parser.add_argument("--backgroundSeconds", type=int, default=420, help="Length of the generated background video.")
+    parser.add_argument("--history", type=str, default="./benchmarks/results/history.json", help="JSON history of results, keyed by git commit.")
+    parser.add_argument("--noHistory", action="store_true", help="Print results without recording them.")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        if 'parse' in args.only:
+            results += bench_parse(args.repeat, args.comments)
+        if 'cards' in args.only:
+            results += bench_cards(args.repeat, work_dir)
+        if 'edit' in args.only or 'main' in args.only:
+            background = background_video(args.backgroundSeconds)
+            if 'edit' in args.only:
+                results += bench_edit(args.comments, args.backends, background, work_dir)
+            if 'main' in args.only:
+                results += bench_main(args.comments, args.mainBackend, background, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for result in results:
+        result['seconds'] = round(result['seconds'], 4)
+
+    history = load_history(args.history)
+    key = f"{commit}-dirty" if dirty else commit
+    # The most recent run recorded for any other commit is the comparison baseline
+    others = [entry for name, entry in history.items() if name != key]
+    baseline = max(others, key=lambda entry: entry['date']) if others else None
+    print_results(results, baseline)
+
+    if not args.noHistory:
+        entry = history.get(key, {'commit': key, 'results': []})
+        # Re-running at the same commit replaces the measurements it repeats and keeps the rest
+        measured = {result_key(result) for result in results}
+        entry['results'] = [result for result in entry['results'] if result_key(result) not in measured] + results
+        entry['date'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        entry['python'] = platform.python_version()
+        entry['platform'] = platform.platform()
+        entry['cpus'] = os.cpu_count()
+        history[key] = entry
+        save_history(args.history, history)
+        print(f"\nResults recorded for {key} in {args.history}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Peak-memory and time benchmark of thread JSON parsing.
+
+Writes a large synthetic thread (comments padded with the kind of metadata Reddit
+returns), then compares keeping the json.load() result, as fetch_thread() does by
+default, with ThreadParser's streaming parse into compact records.
+
+    python benchmarks/bench_thread_parse.py --comments 50000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ThreadParser
+from bench_comment_filter import synthetic_thread
+
+# Stand-in for the ~80 other fields Reddit sends per comment
+PADDING = {
+    'all_awardings': [], 'author_flair_richtext': [], 'gildings': {}, 'treatment_tags': [],
+    'author_fullname': 't2_abcdefgh', 'permalink': '/r/AskReddit/comments/bench/synthetic_thread/abcdefg/',
+    'subreddit_name_prefixed': 'r/AskReddit', 'created_utc': 1700000000.0, 'score_hidden': False,
+    'body_html': '&lt;div class="md"&gt;&lt;p&gt;synthetic&lt;/p&gt;&lt;/div&gt;', 'collapsed': False,
+    'controversiality': 0, 'is_submitter': False, 'stickied': False, 'locked': False
+}
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread JSON parsing memory.")
+    parser.add_argument("--comments", type=int, default=50000, help="Number of synthetic comments.")
+    args = parser.parse_args()
+
+    thread = synthetic_thread(args.comments)
+    thread[0]['data']['children'][0]['kind'] = 't3'
+    for child in thread[1]['data']['children']:
+        child['data'].update(PADDING)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(thread, f)
+        path = f.name
+    del thread
+
+    try:
+        def load_full():
+            with open(path, 'rb') as fp:
+                return json.load(fp)
+
+        def load_streaming():
+            with open(path, 'rb') as fp:
+                return ThreadParser.parse_thread(fp)
+
+        full, full_seconds, full_peak = measure(load_full)
+        del full
+        parsed, stream_seconds, stream_peak = measure(load_streaming)
+
+        backend = ThreadParser.ijson.backend if ThreadParser.ijson else 'json fallback (install ijson to stream)'
+        print(f"payload:             {os.path.getsize(path) / 1e6:8.1f} MB, {len(parsed.comments)} comments")
+        print(f"json.load:           {full_peak / 1e6:8.1f} MB peak, {full_seconds:6.2f} s")
+        print(f"streaming records:   {stream_peak / 1e6:8.1f} MB peak, {stream_seconds:6.2f} s ({backend})")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Wall-clock benchmark of the VideoEditService render backends.
+
+Generates a synthetic background video, tone MP3s and cards with ffmpeg, then
+renders the same segments with every backend.
+
+    python benchmarks/bench_video_backends.py --segments 5 20 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from VideoEditService import VideoEditService, RENDER_BACKENDS
+
+
+def ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', *args], check=True)
+
+
+def make_inputs(work_dir, segments, segment_seconds):
+    audio_folder = os.path.join(work_dir, 'audio')
+    images_folder = os.path.join(work_dir, 'images')
+    os.makedirs(audio_folder)
+    os.makedirs(images_folder)
+
+    background = os.path.join(work_dir, 'background.mp4')
+    ffmpeg('-f', 'lavfi', '-i', f"testsrc2=size=1080x1920:rate=30:duration={segments * segment_seconds + 5}",
+           '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', background)
+
+    for i in range(segments):
+        ffmpeg('-f', 'lavfi', '-i', f"sine=frequency={300 + i}:duration={segment_seconds}",
+               '-c:a', 'libmp3lame', os.path.join(audio_folder, f"comment{i:03d}.mp3"))
+        ffmpeg('-f', 'lavfi', '-i', 'color=c=0x1a1a1b:size=820x300',
+               '-frames:v', '1', os.path.join(images_folder, f"comment{i:03d}.png"))
+    return background, audio_folder, images_folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video render backends.")
+    parser.add_argument("--segments", type=int, nargs="*", default=[5, 20, 50], help="Segment counts to benchmark.")
+    parser.add_argument("--segmentSeconds", type=float, default=2.0, help="Audio length of each segment.")
+    parser.add_argument("--backends", nargs="*", default=list(RENDER_BACKENDS), help="Backends to benchmark.")
+    args = parser.parse_args()
+
+    results = []
+    for segments in args.segments:
+        with tempfile.TemporaryDirectory() as work_dir:
+            background, audio_folder, images_folder = make_inputs(work_dir, segments, args.segmentSeconds)
+            for backend in args.backends:
+                output_path = os.path.join(work_dir, f"output_{backend}.mp4")
+                service = VideoEditService(
+                    input_video_path=background,
+                    output_video_path=output_path,
+                    images_folder=images_folder,
+                    audio_folder=audio_folder,
+                    backend=backend
+                )
+                start = time.perf_counter()
+                service.edit_video()
+                elapsed = time.perf_counter() - start
+                # edit_video reports errors instead of raising, so a failed render would look like a fast one
+                if not os.path.exists(output_path):
+                    raise RuntimeError(f"edit_video with the {backend} backend did not write {output_path}")
+                results.append({'segments': segments, 'backend': backend, 'seconds': round(elapsed, 3)})
+
+    print()
+    for result in results:
+        print(f"segments={result['segments']:<4} backend={result['backend']:<8} {result['seconds']:8.2f} s")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Offline stand-in for Google TTS, shared by the benchmarks. main.py picks it up through
+its test hook, so whole runs can be timed in a fresh process:
+
+    TTS_BACKEND=fake_tts:FakeTTSBackend PYTHONPATH=benchmarks python main.py --threadFile ...
+"""
+import math
+
+from SpeechEstimator import DEFAULT_CHARS_PER_SECOND, UTTERANCE_OVERHEAD
+
+# One silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, mono, 104 bytes, 1152 samples
+SILENT_FRAME = b'\xff\xfb\x10\xc0' + b'\x00' * 100
+FRAME_SECONDS = 1152 / 44100
+
+
+class FakeTTSBackend:
+    """Stands in for GoogleTTSBackend, returning silence as long as real speech would be"""
+    def synthesize(self, text, voice):
+        rate = voice.speaking_rate or 1.0
+        seconds = UTTERANCE_OVERHEAD + len(text) / (DEFAULT_CHARS_PER_SECOND * rate)
+        return SILENT_FRAME * math.ceil(seconds / FRAME_SECONDS)
@@ -1,20 +1,15 @@
 import argparse
 from RedditAPIService import RedditAPIService
-from TTSService import TTSGenerator
-from ImageService import ImageService
-from VideoEditService import VideoEditService
+from HttpService import HttpService
+from SpeechEstimator import SpeechDurationEstimator
+from Workspace import Workspace
+import Instrumentation
+import importlib
 import os
 import html
 
-# Clearing files in specified folders
-def clear_folder(folder_path):
-    if os.path.exists(folder_path):
-        for file in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, file)
-            try:
-                os.unlink(file_path)
-            except Exception as e:
-                print(f"Could not delete {file_path}. Reason: {e}")
+class DurationBudgetError(ValueError):
+    """--maxDuration leaves no room for any comment after the title"""
 
 # Display all comments with indices
 def display_all_comments(comments):
@@ -48,76 +43,207 @@ def choose_comments_by_input(all_comments):
         except ValueError:
             print("Invalid input. Please enter valid indices separated by commas.")
 
-# Argument parser
-parser = argparse.ArgumentParser(description="Automate video creation from Reddit threads.")
-parser.add_argument("--redditURL", type=str, required=True, help="URL of the Reddit thread to process.")
-parser.add_argument("--topComments", type=int, default=5, help="Number of top comments to process.")
-parser.add_argument("--selectComments", action="store_true", help="Enable manual selection of comments.")
-parser.add_argument("--language", type=str, default="pl-PL", help="Language code for TTS.")
-parser.add_argument("--voice", type=str, default="pl-PL-Standard-G", help="TTS voice name.")
-parser.add_argument("--gender", type=str, default="MALE", choices=["MALE", "FEMALE", "NEUTRAL"], help="Gender of the TTS voice.")
-parser.add_argument("--rate", type=float, default=1.2, help="Speaking rate for TTS.")
-parser.add_argument("--pitch", type=float, default=0.2, help="Pitch for TTS.")
-parser.add_argument("--inputVideo", type=str, default="./input_videos/mcparkour6min.mp4", help="Input video path.")
-parser.add_argument("--outputVideo", type=str, default="./final_output/output.mp4", help="Output video path.")
-parser.add_argument("--outputAudioFolder", type=str, default="output_audio", help="Folder for audio files.")
-parser.add_argument("--outputImagesFolder", type=str, default="output_images", help="Folder for image files.")
-parser.add_argument("--debug", action="store_true", help="Enable debug mode.")
-args = parser.parse_args()
-
-# Clear folders
-clear_folder(args.outputAudioFolder)
-clear_folder(args.outputImagesFolder)
-
-# Fetch the Reddit thread
-thread = RedditAPIService(args.redditURL)
-thread.fetch_thread()
-info = thread.get_thread_info()
-
-# Fetch all comments
-all_comments = thread.get_all_comments()
-
-# If --selectComments is enabled, allow manual selection
-if args.selectComments:
-    display_all_comments(all_comments)
-    top_comments = choose_comments_by_input(all_comments)  # Comments are selected in the specified order
-else:
-    # Default to selecting top comments
-    top_comments = thread.get_top_comments(n=args.topComments)
-
-# Debugging output
-if args.debug:
-    print("\nSelected Comments:")
-    for i, comment in enumerate(top_comments):
-        print(f"{i}: {comment}")
-
-# Process TTS and images
-ttsClient = TTSGenerator(language_code=args.language, voice_name=args.voice, ssml_gender=args.gender, speaking_rate=args.rate, pitch=args.pitch)
-imageService = ImageService()
-titleImageService = ImageService(font_path='./fonts/reddit_sans/static/RedditSans-ExtraBold.ttf')
-
-ttsClient.text_to_speech(html.unescape(info['title']), filename=os.path.join(args.outputAudioFolder, 'comment0.mp3'))
-titleImageService.create_reddit_style_image(
-    html.unescape(info['title']),
-    output_path=os.path.join(args.outputImagesFolder, 'comment0.png'),
-    subreddit=info['subreddit'],
-    username=info['author']
-)
-
-for i, comment in enumerate(top_comments, start=1):
-    ttsClient.text_to_speech(html.unescape(comment['body']), filename=os.path.join(args.outputAudioFolder, f"comment{i}.mp3"))
-    imageService.create_reddit_style_image(
-        html.unescape(comment['body']),
-        output_path=os.path.join(args.outputImagesFolder, f"comment{i}.png"),
-        subreddit=info['subreddit'],
-        username=comment['author']
+def build_parser():
+    # Argument parser
+    parser = argparse.ArgumentParser(description="Automate video creation from Reddit threads.")
+    parser.add_argument("--redditURL", type=str, default=None, help="URL of the Reddit thread to process (required unless --threadFile is given).")
+    parser.add_argument("--threadFile", type=str, default=None, help="Read the thread JSON from this file instead of fetching it.")
+    parser.add_argument("--streamJSON", action="store_true", help="Parse the thread JSON incrementally into compact records (uses ijson if installed).")
+    parser.add_argument("--topComments", type=int, default=5, help="Number of top comments to process.")
+    parser.add_argument("--selectComments", action="store_true", help="Enable manual selection of comments.")
+    parser.add_argument("--commentDepth", type=int, default=0, help="Include replies down to this depth (0 = top-level comments only).")
+    parser.add_argument("--expandMore", action="store_true", help="Expand collapsed \"more comments\" stubs through the Reddit API.")
+    parser.add_argument("--maxInFlight", type=int, default=4, help="Concurrent requests when expanding \"more comments\" stubs.")
+    parser.add_argument("--rankBy", type=str, default="order", choices=["order", "ups", "length"], help="How top comments are ranked.")
+    parser.add_argument("--targetCommentSeconds", type=float, default=8.0, help="Preferred spoken length of a comment for --rankBy length.")
+    parser.add_argument("--blockPattern", type=str, action="append", default=None, help="Regex; comments matching it are skipped (repeatable).")
+    parser.add_argument("--maxDuration", type=float, default=None, help="Pack comments into this many seconds of predicted speech before synthesis.")
+    parser.add_argument("--language", type=str, default="pl-PL", help="Language code for TTS.")
+    parser.add_argument("--voice", type=str, default="pl-PL-Standard-G", help="TTS voice name.")
+    parser.add_argument("--gender", type=str, default="MALE", choices=["MALE", "FEMALE", "NEUTRAL"], help="Gender of the TTS voice.")
+    parser.add_argument("--rate", type=float, default=1.2, help="Speaking rate for TTS.")
+    parser.add_argument("--pitch", type=float, default=0.2, help="Pitch for TTS.")
+    parser.add_argument("--inputVideo", type=str, default="./input_videos/mcparkour6min.mp4", help="Input video path, or a folder of background videos to choose from.")
+    parser.add_argument("--outputVideo", type=str, default="./final_output/output.mp4", help="Output video path.")
+    parser.add_argument("--outputAudioFolder", type=str, default=None, help="Keep audio files in this folder (default: the run's own workspace).")
+    parser.add_argument("--outputImagesFolder", type=str, default=None, help="Keep image files in this folder (default: the run's own workspace).")
+    parser.add_argument("--workspaceRoot", type=str, default=None, help="Folder in which every run creates its own workspace (default: system temp folder).")
+    parser.add_argument("--tmpfsWorkspace", action="store_true", help="Create the run workspace in RAM under /dev/shm to cut disk I/O.")
+    parser.add_argument("--keepWorkspace", action="store_true", help="Keep the run workspace with its audio, cards and manifest.json.")
+    parser.add_argument("--httpCacheFolder", type=str, default="./cache/http", help="Folder for cached Reddit responses (empty string disables caching).")
+    parser.add_argument("--httpCacheTTL", type=float, default=300, help="Seconds a cached Reddit response is used without revalidation.")
+    parser.add_argument("--ttsWorkers", type=int, default=4, help="Number of concurrent TTS requests.")
+    parser.add_argument("--ttsCacheFolder", type=str, default="./cache/tts", help="Folder for cached TTS audio (empty string disables caching).")
+    parser.add_argument("--imageWorkers", type=int, default=None, help="Number of card rendering processes (default: in-process unless there are enough cards to pay for a pool).")
+    parser.add_argument("--renderBackend", type=str, default="moviepy", choices=["moviepy", "ffmpeg"], help="Video render backend.")
+    parser.add_argument("--streamingRender", action="store_true", help="Encode segment by segment and join them without re-encoding.")
+    parser.add_argument("--segmentCacheFolder", type=str, default=None, help="Reuse encoded segments from this folder (implies --streamingRender).")
+    parser.add_argument("--encodeProfile", type=str, nargs="+", default=["default"], choices=["default", "1080x1920", "720x1280", "draft"],
+                        help="Encode profiles; the first is written to --outputVideo, the others beside it from the same composite pass.")
+    parser.add_argument("--preset", type=str, default=None, help="x264 preset for every encode profile (e.g. veryfast, medium, slow).")
+    parser.add_argument("--crf", type=int, default=None, help="x264 constant rate factor for every encode profile (lower is better quality).")
+    parser.add_argument("--encodeThreads", type=int, default=None, help="Encoder threads for every encode profile (0 = automatic).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the background offset; keep it fixed so cached segments can be reused.")
+    parser.add_argument("--trace", type=str, default=None, help="Write a JSON trace of stage timings, cache counters and peak memory to this file.")
+    parser.add_argument("--traceSummary", action="store_true", help="Print a table of stage timings and counters at the end of the run.")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode.")
+    return parser
+
+def create_http_service(args):
+    return HttpService(cache_dir=args.httpCacheFolder or None, ttl=args.httpCacheTTL)
+
+def create_duration_estimator(args):
+    return SpeechDurationEstimator(os.path.join(args.ttsCacheFolder, 'calibration.json') if args.ttsCacheFolder else None)
+
+def fetch_comments(args, http=None, estimator=None):
+    """
+    Fetches the thread and picks the comments for the video.
+    Returns the thread info and the selected comments in video order.
+    """
+    # Fetch the Reddit thread
+    thread = RedditAPIService(args.redditURL or args.threadFile, http=http or create_http_service(args))
+    with Instrumentation.span('fetch', source='file' if args.threadFile else 'reddit'):
+        if args.threadFile:
+            thread.load_thread_file(args.threadFile)
+        else:
+            thread.fetch_thread(stream=args.streamJSON)
+        info = thread.get_thread_info()
+
+    comment_options = {'max_depth': args.commentDepth, 'expand_more': args.expandMore, 'max_in_flight': args.maxInFlight,
+                    'blocklist': args.blockPattern}
+
+    # If --selectComments is enabled, allow manual selection
+    if args.selectComments:
+        # Fetch all comments
+        with Instrumentation.span('filter'):
+            all_comments = thread.get_all_comments(**comment_options)
+        display_all_comments(all_comments)
+        top_comments = choose_comments_by_input(all_comments)  # Comments are selected in the specified order
+    else:
+        # Default to selecting top comments
+        if args.maxDuration:
+            # Predict speech length from text so over-long selections are dropped before paying for TTS
+            estimator = estimator or create_duration_estimator(args)
+            voice_key = SpeechDurationEstimator.voice_key(args.language, args.voice, args.gender)
+            estimate = lambda text: estimator.estimate(html.unescape(text), voice_key, args.rate)
+            title_seconds = estimate(info['title'] or '')
+            if title_seconds >= args.maxDuration:
+                raise DurationBudgetError(f"--maxDuration {args.maxDuration:g} seconds is used up by the title alone "
+                                          f"(predicted {title_seconds:.1f} seconds); no comments would fit")
+            comment_options['budget_seconds'] = args.maxDuration - title_seconds
+            comment_options['estimate'] = estimate
+        with Instrumentation.span('filter', rank_by=args.rankBy) as span:
+            top_comments = thread.get_top_comments(n=args.topComments, score=args.rankBy, target_seconds=args.targetCommentSeconds,
+                                                   speaking_rate=args.rate, **comment_options)
+            span.set(selected=len(top_comments))
+        if args.maxDuration:
+            if not top_comments:
+                raise DurationBudgetError(f"No comment fits in the {args.maxDuration - title_seconds:.1f} seconds "
+                                          f"--maxDuration {args.maxDuration:g} leaves after the title")
+            predicted = title_seconds + sum(estimate(comment['body']) for comment in top_comments)
+            print(f"Selected {len(top_comments)} comments, predicted duration {predicted:.1f} of {args.maxDuration} seconds.")
+
+    # Debugging output
+    if args.debug:
+        print("\nSelected Comments:")
+        for i, comment in enumerate(top_comments):
+            print(f"{i}: {comment}")
+    return info, top_comments
+
+# TTS (gRPC), card (PIL) and video (MoviePy) modules are imported by the stage that needs them,
+# so listing comments or failing early never pays their import time
+def create_tts_client(args, backend=None, estimator=None):
+    from TTSService import TTSGenerator
+    return TTSGenerator(language_code=args.language, voice_name=args.voice, ssml_gender=args.gender, speaking_rate=args.rate, pitch=args.pitch,
+                        backend=backend, cache_dir=args.ttsCacheFolder or None, max_workers=args.ttsWorkers, estimator=estimator)
+
+def create_workspace(args, root=None):
+    """A fresh workspace for one run, so runs on the same machine never share intermediate files"""
+    return Workspace(root=root or args.workspaceRoot, audio_folder=args.outputAudioFolder, images_folder=args.outputImagesFolder,
+                     tmpfs=args.tmpfsWorkspace, keep=args.keepWorkspace or args.debug)
+
+def synthesize_audio(workspace, ttsClient, info, top_comments):
+    """Synthesize the title and all comments in one concurrent batch; returns the audio paths in video order"""
+    tts_items = [(html.unescape(info['title']), workspace.audio_path(0))]
+    for i, comment in enumerate(top_comments, start=1):
+        tts_items.append((html.unescape(comment['body']), workspace.audio_path(i)))
+    return ttsClient.synthesize_many(tts_items)
+
+def render_cards(args, imageService, workspace, info, top_comments, workers=None):
+    """Render the title card and all comment cards in one parallel batch; returns the card paths in video order"""
+    cards = [{
+        'text': html.unescape(info['title']),
+        'output_path': workspace.image_path(0),
+        'subreddit': info['subreddit'],
+        'username': info['author'],
+        'font_path': './fonts/reddit_sans/static/RedditSans-ExtraBold.ttf'
+    }]
+    for i, comment in enumerate(top_comments, start=1):
+        cards.append({
+            'text': html.unescape(comment['body']),
+            'output_path': workspace.image_path(i),
+            'subreddit': info['subreddit'],
+            'username': comment['author']
+        })
+    return imageService.render_batch(cards, workers=workers or args.imageWorkers)
+
+def create_image_service():
+    from ImageService import ImageService
+    return ImageService()
+
+def render_video(args, manifest):
+    from VideoEditService import VideoEditService, encode_profiles
+    # Create the video from the ordered segment manifest
+    videoService = VideoEditService(
+        input_video_path=args.inputVideo,
+        output_video_path=args.outputVideo,
+        manifest=manifest,
+        backend=args.renderBackend,
+        streaming=args.streamingRender,
+        debug_audio=args.debug,
+        segment_cache_dir=args.segmentCacheFolder,
+        seed=args.seed,
+        profiles=encode_profiles(args.encodeProfile, preset=args.preset, crf=args.crf, threads=args.encodeThreads)
     )
+    videoService.edit_video()
+
+def tts_backend_from_env():
+    """Test and benchmark hook: TTS_BACKEND=module:Class replaces Google TTS with an instance of that class"""
+    spec = os.getenv('TTS_BACKEND')
+    if not spec:
+        return None
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.redditURL and not args.threadFile:
+        parser.error("one of --redditURL or --threadFile is required")
+
+    if args.trace or args.traceSummary:
+        Instrumentation.enable()
+    try:
+        with Instrumentation.span('run'):
+            run(args, tts_backend=tts_backend_from_env())
+    except DurationBudgetError as e:
+        parser.error(str(e))
+    finally:
+        Instrumentation.report(args.trace, args.traceSummary)
+
+def run(args, tts_backend=None):
+    """One full pipeline run; tts_backend replaces Google TTS, e.g. with an offline fake"""
+    info, top_comments = fetch_comments(args)
+
+    # Process TTS and images
+    ttsClient = create_tts_client(args, backend=tts_backend)
+    imageService = create_image_service()
+
+    with create_workspace(args) as workspace:
+        audio_paths = synthesize_audio(workspace, ttsClient, info, top_comments)
+        image_paths = render_cards(args, imageService, workspace, info, top_comments)
+        workspace.build_manifest(audio_paths, image_paths)
+        render_video(args, workspace.manifest)
 
-# Create the video
-videoService = VideoEditService(
-    input_video_path=args.inputVideo,
-    output_video_path=args.outputVideo,
-    images_folder=args.outputImagesFolder,
-    audio_folder=args.outputAudioFolder
-)
-videoService.edit_video()
+if __name__ == "__main__":
+    main()
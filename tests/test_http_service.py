@@ -0,0 +1,99 @@
+"""
+HttpService against a local http.server stub: cache hits, ETag revalidation and 429 handling.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from HttpService import HttpService, RateLimitError
+
+BODY = b'{"thread": "stub"}'
+ETAG = '"stub-v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves BODY at /thread with an ETag; /limited answers 429 the first `limited` times"""
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path.startswith('/limited') and server.limited > 0:
+            server.limited -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', str(server.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.limited = 0
+        self.server.retry_after = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.cache_dir = tempfile.mkdtemp(prefix='http_cache_')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def service(self, **options):
+        return HttpService(cache_dir=self.cache_dir, backoff=0.01, **options)
+
+    def test_fresh_cache_entry_is_served_without_a_request(self):
+        http = self.service(ttl=300)
+        self.assertEqual(http.get(f"{self.base_url}/thread"), BODY)
+        self.assertEqual(http.get(f"{self.base_url}/thread"), BODY)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_entry_is_revalidated_with_etag(self):
+        http = self.service(ttl=0)
+        self.assertEqual(http.get(f"{self.base_url}/thread"), BODY)
+        self.assertEqual(http.get(f"{self.base_url}/thread"), BODY)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1][1].get('If-None-Match'), ETAG)
+
+    def test_429_is_retried_after_retry_after(self):
+        self.server.limited = 2
+        http = self.service(max_retries=3)
+        self.assertEqual(http.get(f"{self.base_url}/limited"), BODY)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_429_after_last_retry_raises_rate_limit_error(self):
+        self.server.limited = 10
+        self.server.retry_after = 7
+        # max_delay caps the sleep, so the test does not wait the 7 seconds the server asks for
+        http = self.service(max_retries=1, max_delay=0.01)
+        with self.assertRaises(RateLimitError) as raised:
+            http.get(f"{self.base_url}/limited")
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.retry_after, 7.0)
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
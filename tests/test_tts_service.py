@@ -0,0 +1,79 @@
+"""
+TTSGenerator with a fake synthesis backend: the audio cache, batch deduplication and cache keys.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from TTSService import TTSGenerator
+
+# One silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, mono, 104 bytes, 1152 samples
+SILENT_FRAME = b'\xff\xfb\x10\xc0' + b'\x00' * 100
+
+
+class FakeBackend:
+    """Records every synthesized text and returns a few silent frames per character"""
+    def __init__(self):
+        self.texts = []
+        self.lock = threading.Lock()
+
+    def synthesize(self, text, voice):
+        with self.lock:
+            self.texts.append(text)
+        return SILENT_FRAME * (len(text) + 1)
+
+
+class TTSGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='tts_test_')
+        self.cache_dir = os.path.join(self.work_dir, 'cache')
+        self.backend = FakeBackend()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def generator(self, **voice):
+        return TTSGenerator(backend=self.backend, cache_dir=self.cache_dir, **voice)
+
+    def output(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def test_cache_hit_skips_the_backend(self):
+        tts = self.generator()
+        tts.text_to_speech("Hello there", self.output('first.mp3'))
+        tts.text_to_speech("Hello there", self.output('second.mp3'))
+        self.assertEqual(self.backend.texts, ["Hello there"])
+        with open(self.output('first.mp3'), 'rb') as first, open(self.output('second.mp3'), 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_identical_texts_in_a_batch_are_synthesized_once(self):
+        tts = self.generator()
+        items = [("Same text", self.output('a.mp3')), ("Other text", self.output('b.mp3')),
+                 ("Same text", self.output('c.mp3'))]
+        self.assertEqual(tts.synthesize_many(items), [filename for _, filename in items])
+        self.assertEqual(sorted(self.backend.texts), ["Other text", "Same text"])
+        for _, filename in items:
+            self.assertTrue(os.path.exists(filename))
+
+    def test_every_voice_parameter_changes_the_cache_key(self):
+        base = dict(language_code='pl-PL', voice_name=None, ssml_gender='NEUTRAL', speaking_rate=1.2, pitch=0.2)
+        changes = dict(language_code='en-US', voice_name='pl-PL-Wavenet-A', ssml_gender='FEMALE',
+                       speaking_rate=1.0, pitch=-2.0)
+        base_key = self.generator(**base).cache_key("Hello there")
+        for name, value in changes.items():
+            with self.subTest(parameter=name):
+                key = self.generator(**dict(base, **{name: value})).cache_key("Hello there")
+                self.assertNotEqual(key, base_key)
+        self.assertNotEqual(self.generator(**base).cache_key("Hello"), base_key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import time
+import uuid
+
+import Instrumentation
+from batch import BatchJob, SharedResources, apply_options, run_job_stage
+from main import build_parser
+
+QUEUE_FOLDERS = ('incoming', 'running', 'done', 'failed')
+
+def queue_folders(queue_path):
+    folders = {name: os.path.join(queue_path, name) for name in QUEUE_FOLDERS}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    return folders
+
+def submit_job(queue_path, options):
+    """
+    Adds a job to the queue folder; options use main.py option names, as in a batch job list.
+    The file is renamed into incoming/ only once complete, so a worker never reads half a job.
+    Returns the job id.
+    """
+    folders = queue_folders(queue_path)
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    partial_path = os.path.join(queue_path, f"{job_id}.part")
+    with open(partial_path, 'w', encoding='utf-8') as f:
+        json.dump(options, f)
+    os.replace(partial_path, os.path.join(folders['incoming'], f"{job_id}.json"))
+    return job_id
+
+def claim_next_job(folders):
+    """Moves the oldest incoming job to running/ and returns its id; the rename is atomic, so each job goes to one worker"""
+    for name in sorted(os.listdir(folders['incoming'])):
+        if not name.endswith('.json'):
+            continue
+        try:
+            os.rename(os.path.join(folders['incoming'], name), os.path.join(folders['running'], name))
+        except OSError:
+            continue  # Claimed by another worker in the meantime
+        return name[:-len('.json')]
+    return None
+
+def warm_up(shared, backend):
+    """Loads everything a job needs up front: fonts and icons, the render backend and the TTS client"""
+    from ImageService import load_font, load_icon
+    service = shared.imageService
+    for font_path in (service.font_path, './fonts/reddit_sans/static/RedditSans-ExtraBold.ttf'):
+        try:
+            load_font(font_path, service.font_size)
+        except IOError as e:
+            print(f"Could not preload font {font_path}: {e}")
+    for icon_path, size in (('./assets/avatar.png', service.avatar_size), ('./assets/heart.png', (20, 20)),
+                            ('./assets/bubble.png', (20, 20)), ('./assets/share.png', (20, 20))):
+        try:
+            load_icon(icon_path, size)
+        except IOError as e:
+            print(f"Could not preload icon {icon_path}: {e}")
+
+    # Importing is the expensive part of both; the modules then stay loaded for every job
+    import VideoEditService  # noqa: F401
+    if backend == 'moviepy':
+        import moviepy  # noqa: F401
+    try:
+        # Creating the client loads gRPC and the credentials once
+        shared.tts_client_for(build_parser().parse_args([]))
+        shared.tts_backend.client
+    except Exception as e:
+        print(f"TTS client will be created with the first job: {e}")
+
+def run_job(shared, folders, job_id, work_folder, output_folder):
+    """Runs one claimed job through every stage and files it under done/ or failed/ with its report"""
+    running_path = os.path.join(folders['running'], f"{job_id}.json")
+    args = build_parser().parse_args([])
+    args.workspaceRoot = work_folder
+    args.outputVideo = os.path.join(output_folder, f"{job_id}.mp4")
+    job = BatchJob(job_id, args)
+    try:
+        with open(running_path, 'r', encoding='utf-8') as f:
+            options = json.load(f)
+        error = apply_options(args, options) if isinstance(options, dict) else "Job file must contain a JSON object"
+    except (OSError, ValueError) as e:
+        error = f"Invalid job file: {e}"
+    if error:
+        job.error, job.failed_stage = error, 'load'
+
+    for name, func in shared.stages():
+        run_job_stage(name, func, job)
+    shared.finish(job)
+
+    status = 'failed' if job.error else 'done'
+    with open(os.path.join(folders[status], f"{job_id}.report.json"), 'w', encoding='utf-8') as f:
+        json.dump(job.report(), f, indent=2)
+    os.replace(running_path, os.path.join(folders[status], f"{job_id}.json"))
+    return job
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived worker that keeps clients, fonts and assets warm and renders queued jobs.")
+    parser.add_argument("--queue", type=str, default="./queue", help="Job queue folder with incoming/, running/, done/ and failed/.")
+    parser.add_argument("--submit", type=str, default=None, help="Queue a job (JSON object or path to a JSON file) and exit.")
+    parser.add_argument("--workFolder", type=str, default="./batch_work", help="Folder for per-job workspaces.")
+    parser.add_argument("--outputFolder", type=str, default="./final_output/queue", help="Folder for videos of jobs without outputVideo.")
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between checks of an empty queue.")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty instead of waiting for more jobs.")
+    parser.add_argument("--recover", action="store_true", help="Queue jobs left in running/ by a stopped worker again (only with a single worker).")
+    parser.add_argument("--imageWorkers", type=int, default=1, help="Card rendering processes per job (1 keeps fonts warm in this process).")
+    parser.add_argument("--renderBackend", type=str, default="moviepy", choices=["moviepy", "ffmpeg"], help="Backend to preload.")
+    parser.add_argument("--trace", type=str, default=None, help="Write a JSON trace of every job to this file on exit.")
+    parser.add_argument("--traceSummary", action="store_true", help="Print a table of stage timings and counters on exit.")
+    worker_args = parser.parse_args()
+
+    if worker_args.submit:
+        source = worker_args.submit
+        if os.path.exists(source):
+            with open(source, 'r', encoding='utf-8') as f:
+                source = f.read()
+        job_id = submit_job(worker_args.queue, json.loads(source))
+        print(f"Queued job {job_id} in {worker_args.queue}.")
+        return
+
+    if worker_args.trace or worker_args.traceSummary:
+        Instrumentation.enable()
+    folders = queue_folders(worker_args.queue)
+    if worker_args.recover:
+        for name in os.listdir(folders['running']):
+            os.replace(os.path.join(folders['running'], name), os.path.join(folders['incoming'], name))
+
+    start = time.perf_counter()
+    shared = SharedResources(card_workers=worker_args.imageWorkers)
+    warm_up(shared, worker_args.renderBackend)
+    print(f"Worker ready in {time.perf_counter() - start:.1f} seconds, watching {folders['incoming']}.")
+
+    try:
+        while True:
+            job_id = claim_next_job(folders)
+            if job_id is None:
+                if worker_args.once:
+                    break
+                time.sleep(worker_args.poll)
+                continue
+            print(f"Starting job {job_id}.")
+            job = run_job(shared, folders, job_id, worker_args.workFolder, worker_args.outputFolder)
+            if job.error:
+                print(f"Job {job_id} failed in {job.failed_stage}: {job.error}")
+            else:
+                print(f"Job {job_id} finished: {job.args.outputVideo} in {sum(job.timings.values()):.1f} seconds.")
+    except KeyboardInterrupt:
+        print("Worker stopped.")
+    finally:
+        Instrumentation.report(worker_args.trace, worker_args.traceSummary)
+
+if __name__ == "__main__":
+    main()